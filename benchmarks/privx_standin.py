@@ -0,0 +1,371 @@
+"""Local stand-in for the PrivX REST endpoints used by the collection."""
+
+import argparse
+import base64
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import re
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+DEFAULT_PAGE_LIMIT = 50
+
+
+def _token(lifetime):
+    def b64(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii').rstrip('=')
+    return '%s.%s.%s' % (b64({'alg': 'none'}), b64({'exp': int(time.time() + lifetime), 'jti': uuid.uuid4().hex}), 'standin')
+
+
+class PrivXStandInState(object):
+    """Roles, access groups and hosts served by the stand-in, plus request counters."""
+
+    def __init__(self, hosts=1000, roles=100, access_groups=10, token_lifetime=300):
+        self.token_lifetime = token_lifetime
+        self.roles = [{'id': 'role-%05d' % i, 'name': 'role-%d' % i} for i in range(roles)]
+        self.access_groups = [{'id': 'ag-%04d' % i, 'name': 'access-group-%d' % i} for i in range(access_groups)]
+        self.hosts = {}
+        for i in range(hosts):
+            host = {
+                'id': 'host-%06d' % i,
+                'common_name': 'host%d.example.com' % i,
+                'external_id': 'ext-%d' % i,
+                'addresses': ['10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255)],
+                'access_group_id': self.access_groups[i % len(self.access_groups)]['id'] if self.access_groups else '',
+                'tags': ['tag-%d' % (i % 7)],
+                'services': [{'service': 'SSH', 'address': 'host%d.example.com' % i, 'port': 22, 'source': 'UI'}],
+                'principals': [{'principal': 'root', 'passphrase': '', 'use_user_account': False, 'source': 'UI',
+                                'roles': [dict(self.roles[i % len(self.roles)])] if self.roles else []}],
+                'updated': '2024-01-01T00:00:00Z',
+            }
+            self.hosts[host['id']] = host
+        self.tokens = set()
+        self.calls = {}
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+
+    def store(self, host):
+        """Fill in principal role names as PrivX does; callers hold the lock."""
+        names = {role['id']: role['name'] for role in self.roles}
+        for principal in host.get('principals') or []:
+            principal['roles'] = [dict(role, name=names.get(role.get('id'), '')) for role in principal.get('roles') or []]
+        self.hosts[host['id']] = host
+
+    def count(self, endpoint, size):
+        with self.lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            self.bytes_sent += size
+
+    def reset_counters(self):
+        with self.lock:
+            self.calls = {}
+            self.bytes_sent = 0
+
+    def stats(self):
+        with self.lock:
+            return {'calls': dict(self.calls), 'bytes_sent': self.bytes_sent, 'hosts': len(self.hosts)}
+
+
+def _page(items, query, max_page_size, default_limit=DEFAULT_PAGE_LIMIT):
+    """Apply offset/limit; without a default limit an unpaged request returns everything."""
+    offset = int(query.get('offset', ['0'])[0] or 0)
+    if 'limit' in query:
+        limit = min(int(query['limit'][0]), max_page_size)
+    elif default_limit is None:
+        limit = len(items)
+    else:
+        limit = default_limit
+    return {'count': len(items), 'items': items[offset:offset + limit]}
+
+
+def _now():
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime()) + '.%06dZ' % (time.time() % 1 * 1000000)
+
+
+def _sorted(items, query):
+    key = query.get('sortkey', [None])[0]
+    if not key:
+        return items
+    reverse = query.get('sortdir', ['ASC'])[0].upper() == 'DESC'
+    return sorted(items, key=lambda item: str(item.get(key) or ''), reverse=reverse)
+
+
+def _search(hosts, payload):
+    """Partial, case-insensitive matching on the fields the collection searches by."""
+    matches = hosts
+    for field in ('common_name', 'external_id', 'addresses'):
+        wanted = [str(v).lower() for v in payload.get(field) or []]
+        if not wanted:
+            continue
+
+        def hit(host, field=field, wanted=wanted):
+            values = host.get(field) or []
+            values = values if isinstance(values, list) else [values]
+            return any(w in str(v).lower() for w in wanted for v in values)
+        matches = [h for h in matches if hit(h)]
+    return matches
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without this, delayed ACKs add ~40ms per response
+    disable_nagle_algorithm = True
+    HOST_RE = re.compile(r'^/host-store/api/v1/hosts/([^/]+)$')
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _send(self, endpoint, status, body=None, headers=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.state.count(endpoint, len(data))
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_raw(self, body):
+        # Control endpoints are not counted as API calls
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _authorized(self):
+        auth = self.headers.get('Authorization', '')
+        return auth.startswith('Bearer ') and auth[7:] in self.state.tokens
+
+    def _handle(self, method):
+        raw = self._body()
+        if self.path == '/__standin__/stats':
+            return self._send_raw(self.state.stats())
+        if self.path == '/__standin__/reset':
+            self.state.reset_counters()
+            return self._send_raw({})
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.throttle_rate and random.random() < self.server.throttle_rate:
+            return self._send('throttled', 429, {'error': 'too many requests'}, {'Retry-After': '0'})
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        path = url.path
+        state = self.state
+
+        if method == 'POST' and path == '/auth/api/v1/oauth/token':
+            token = _token(state.token_lifetime)
+            with state.lock:
+                state.tokens.add(token)
+            return self._send('auth', 200, {'access_token': token, 'token_type': 'Bearer', 'expires_in': state.token_lifetime})
+
+        if not self._authorized():
+            return self._send('unauthorized', 401, {'error': 'unauthorized'})
+
+        if method == 'GET' and path == '/role-store/api/v1/roles':
+            # The role list is not paginated by PrivX
+            return self._send('get_roles', 200, _page(state.roles, query, self.server.max_page_size, None))
+        if method == 'GET' and path == '/authorizer/api/v1/accessgroups':
+            return self._send('get_access_groups', 200, _page(state.access_groups, query, self.server.max_page_size))
+        if method == 'GET' and path == '/host-store/api/v1/hosts':
+            with state.lock:
+                hosts = list(state.hosts.values())
+            return self._send('get_hosts', 200, _page(_sorted(hosts, query), query, self.server.max_page_size))
+        if method == 'POST' and path == '/host-store/api/v1/hosts/search':
+            payload = json.loads(raw or b'{}')
+            with state.lock:
+                hosts = list(state.hosts.values())
+            return self._send('search_hosts', 200, _page(_sorted(_search(hosts, payload), query), query, self.server.max_page_size))
+        if method == 'POST' and path == '/host-store/api/v1/hosts':
+            host = json.loads(raw or b'{}')
+            host['id'] = str(uuid.uuid4())
+            host['updated'] = _now()
+            with state.lock:
+                state.store(host)
+            return self._send('create_host', 201, {'id': host['id']})
+
+        match = self.HOST_RE.match(path)
+        if match:
+            host_id = match.group(1)
+            with state.lock:
+                host = state.hosts.get(host_id)
+                if host is not None and method == 'PUT':
+                    updated = json.loads(raw or b'{}')
+                    updated['id'] = host_id
+                    updated['updated'] = _now()
+                    state.store(updated)
+                elif host is not None and method == 'DELETE':
+                    del state.hosts[host_id]
+            endpoint = {'GET': 'get_host', 'PUT': 'update_host', 'DELETE': 'delete_host'}[method]
+            if host is None:
+                return self._send(endpoint, 404, {'error': 'not found'})
+            return self._send(endpoint, 200, host if method == 'GET' else None)
+
+        return self._send('unknown', 404, {'error': 'unknown endpoint'})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+def _self_signed_certificate(directory):
+    cert = os.path.join(directory, 'standin.crt')
+    key = os.path.join(directory, 'standin.key')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+         '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1',
+         '-keyout', key, '-out', cert],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return cert, key
+
+
+def _make_server(state, cert, key, latency, max_page_size, throttle_rate=0.0, port=0):
+    server = ThreadingHTTPServer(('127.0.0.1', port), _Handler, bind_and_activate=False)
+    # Room for the bursts of connections opened by concurrent clients
+    server.request_queue_size = 128
+    server.server_bind()
+    server.server_activate()
+    server.daemon_threads = True
+    server.state = state
+    server.latency = latency
+    server.max_page_size = max_page_size
+    server.throttle_rate = throttle_rate
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    return server
+
+
+def _serve(conn, state_kwargs, cert, key, latency, max_page_size, throttle_rate):
+    server = _make_server(PrivXStandInState(**state_kwargs), cert, key, latency, max_page_size, throttle_rate)
+    conn.send(server.server_address[1])
+    conn.close()
+    server.serve_forever()
+
+
+class PrivXStandIn(object):
+    """
+    HTTPS server emulating the PrivX API on localhost.
+
+    The server runs in a child process so that its memory and CPU use do not
+    distort measurements taken in the calling process. Request counters are
+    read with stats() and cleared with reset().
+    """
+
+    def __init__(self, hosts=1000, roles=100, access_groups=10, token_lifetime=300,
+                 latency=0.0, max_page_size=1000, throttle_rate=0.0):
+        self.state_kwargs = {
+            'hosts': hosts, 'roles': roles,
+            'access_groups': access_groups, 'token_lifetime': token_lifetime,
+        }
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.throttle_rate = throttle_rate
+        self.port = None
+        self._process = None
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._cert, self._key = _self_signed_certificate(self._tmpdir.name)
+        with open(self._cert) as f:
+            self.ca_cert = f.read()
+
+    def config(self, **overrides):
+        """Return a collection config dict pointing at this server."""
+        config = {
+            'hostname': 'localhost',
+            'hostport': self.port,
+            'ca_cert': self.ca_cert,
+            'oauth_client_id': 'privx-external',
+            'oauth_client_secret': 'secret',
+            'api_client_id': 'api-client',
+            'api_client_secret': 'secret',
+        }
+        config.update(overrides)
+        return config
+
+    def _control(self, path):
+        context = ssl.create_default_context(cadata=self.ca_cert)
+        conn = http.client.HTTPSConnection('localhost', self.port, context=context)
+        try:
+            conn.request('GET', path)
+            return json.loads(conn.getresponse().read())
+        finally:
+            conn.close()
+
+    def stats(self):
+        return self._control('/__standin__/stats')
+
+    def reset(self):
+        self._control('/__standin__/reset')
+
+    def __enter__(self):
+        parent, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_serve, daemon=True,
+            args=(child, self.state_kwargs, self._cert, self._key, self.latency, self.max_page_size, self.throttle_rate),
+        )
+        self._process.start()
+        self.port = parent.recv()
+        return self
+
+    def __exit__(self, *exc):
+        self._process.terminate()
+        self._process.join()
+        self._tmpdir.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--hosts', type=int, default=1000)
+    parser.add_argument('--roles', type=int, default=100)
+    parser.add_argument('--access-groups', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every request.")
+    parser.add_argument('--max-page-size', type=int, default=1000)
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help="Fraction of API requests answered with 429 Too Many Requests.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='privx-standin-') as tmpdir:
+        cert, key = _self_signed_certificate(tmpdir)
+        state = PrivXStandInState(hosts=args.hosts, roles=args.roles, access_groups=args.access_groups)
+        server = _make_server(state, cert, key, args.latency, args.max_page_size, args.throttle_rate, args.port)
+        print("Serving PrivX stand-in on https://localhost:%d (CA certificate: %s)" % (args.port, cert))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+"""
+Offline benchmarks for the PrivX collection.
+
+Every entry point is run against a local PrivX stand-in server and reported
+with its API calls (in total, per endpoint and per host), wall-clock time
+and peak Python memory. Requires the privx_api SDK and the openssl CLI.
+
+    python benchmarks/run_benchmarks.py --hosts 10000 --roles 2000 --latency 0.01
+"""
+
+import argparse
+import atexit
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from privx_standin import PrivXStandIn
+
+COLLECTION_NAMESPACE = 'garnser'
+COLLECTION_NAME = 'privx'
+
+
+def _bootstrap_collection():
+    """Make this checkout importable as ansible_collections.garnser.privx."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parts = root.split(os.sep)
+    if len(parts) > 3 and parts[-3] == 'ansible_collections':
+        sys.path.insert(0, os.sep.join(parts[:-3]))
+        return
+    base = tempfile.mkdtemp(prefix='privx-bench-')
+    # Imports need the link until the process exits
+    atexit.register(shutil.rmtree, base, True)
+    namespace = os.path.join(base, 'ansible_collections', COLLECTION_NAMESPACE)
+    os.makedirs(namespace)
+    os.symlink(root, os.path.join(namespace, COLLECTION_NAME))
+    sys.path.insert(0, base)
+
+
+def _fresh_process():
+    """Forget in-process caches, as every Ansible task starts in a new process."""
+    from ansible_collections.garnser.privx.plugins.module_utils import client, directory, governor
+    from ansible_collections.garnser.privx.plugins.lookup import privx_lookup
+    client._CLIENTS.clear()
+    client._POOL.close()
+    directory._DIRECTORIES.clear()
+    governor._GOVERNORS.clear()
+    privx_lookup._TERM_CACHE = privx_lookup.TermCache()
+
+
+class _TaskModule(object):
+    """Minimal stand-in for AnsibleModule, for calling module functions directly."""
+
+    def __init__(self, params, check_mode=False):
+        self.params = params
+        self.check_mode = check_mode
+
+    def fail_json(self, **kwargs):
+        raise RuntimeError(kwargs.get('msg'))
+
+    def exit_json(self, **kwargs):
+        raise RuntimeError("Unexpected exit_json: %s" % kwargs.get('msg'))
+
+
+def _module_params(config, **extra):
+    from ansible_collections.garnser.privx.plugins.module_utils.privx_utils import _get_common_config_spec
+    from ansible_collections.garnser.privx.plugins.module_utils.fingerprint import get_fingerprint_spec
+    from ansible_collections.garnser.privx.plugins.module_utils.host_store import DEFAULT_SEARCH_PAGE_SIZE
+
+    params = {'config': {key: spec.get('default') for key, spec in _get_common_config_spec().items()}}
+    params['config'].update(config)
+    params.update({key: spec.get('default') for key, spec in get_fingerprint_spec().items()})
+    params['search_page_size'] = DEFAULT_SEARCH_PAGE_SIZE
+    params.update(extra)
+    return params
+
+
+def _host(i, roles):
+    """Desired state of a host: even numbers exist on the stand-in, odd numbers are new."""
+    return {
+        'common_name': 'host%d.example.com' % i if i % 2 == 0 else 'new%d.example.com' % i,
+        'addresses': ['192.168.%d.%d' % (i >> 8 & 255, i & 255)],
+        'principals': [{
+            'principal': 'root',
+            'use_user_account': False,
+            'roles': [{'name': 'role-%d' % ((i + n) % roles)} for n in range(3)],
+        }],
+    }
+
+
+def bench_add_host(server, config, args):
+    from ansible_collections.garnser.privx.plugins.module_utils.client import create_privx_api, enable_connection_pool
+    from ansible_collections.garnser.privx.plugins.modules import add_host
+
+    count = min(args.tasks, args.hosts)
+    for i in range(count):
+        _fresh_process()
+        enable_connection_pool()
+        api = create_privx_api(config)
+        result = {'changed': False, 'failed': False, 'msg': ''}
+        params = _module_params(config, return_details=args.return_details)
+        add_host.add_host(api, _TaskModule(params), _host(i, args.roles), result)
+        if result['failed']:
+            raise RuntimeError(result['msg'])
+    return count
+
+
+def bench_privx_hosts(server, config, args):
+    from ansible_collections.garnser.privx.plugins.module_utils.client import create_privx_api
+    from ansible_collections.garnser.privx.plugins.module_utils.host_store import PrivXHostStore
+
+    count = min(args.tasks, args.hosts)
+    _fresh_process()
+    store = PrivXHostStore(create_privx_api(config))
+    results, summary = store.reconcile([_host(i, args.roles) for i in range(count)], concurrency=args.concurrency)
+    if summary['failed']:
+        raise RuntimeError(next(r['msg'] for r in results if r['action'] == 'failed'))
+    return count
+
+
+def bench_role_store(server, config, args):
+    from ansible_collections.garnser.privx.plugins.module_utils.client import create_privx_api
+    from ansible_collections.garnser.privx.plugins.module_utils.role_store import PrivXRoleStore
+
+    count = min(args.tasks, args.hosts)
+    for i in range(count):
+        _fresh_process()
+        api = create_privx_api(config)
+        for role in _host(i, args.roles)['principals'][0]['roles']:
+            PrivXRoleStore.get_role_id_by_input(api, role)
+    return count
+
+
+def bench_authorizer(server, config, args):
+    from ansible_collections.garnser.privx.plugins.module_utils.client import create_privx_api
+    from ansible_collections.garnser.privx.plugins.module_utils.authorizer import PrivXAuthorizer
+
+    count = min(args.tasks, args.hosts)
+    for i in range(count):
+        _fresh_process()
+        api = create_privx_api(config)
+        PrivXAuthorizer.get_access_group_by_input(api, 'access-group-%d' % (i % args.access_groups))
+    return count
+
+
+def bench_privx_lookup(server, config, args):
+    from ansible_collections.garnser.privx.plugins.lookup.privx_lookup import LookupModule
+
+    _fresh_process()
+    lookup = LookupModule()
+    for i in range(args.lookups):
+        lookup.run(['get_roles', 'get_access_groups', 'get_hosts'], config=config)
+    return args.hosts
+
+
+def bench_get_host(server, config, args):
+    from ansible_collections.garnser.privx.plugins.lookup.privx_lookup import LookupModule
+
+    count = min(args.tasks, args.hosts)
+    _fresh_process()
+    lookup = LookupModule()
+    for i in range(count):
+        lookup.run(['get_host'], config=config, filter='host-%06d' % i, cache=False)
+    return count
+
+
+def bench_fan_out(server, config, args):
+    from ansible_collections.garnser.privx.plugins.lookup.privx_lookup import LookupModule
+
+    count = min(args.tasks, args.hosts)
+    _fresh_process()
+    LookupModule().run(['get_host'], config=config, filter=['host-%06d' % i for i in range(count)],
+                       fan_out=True, concurrency=args.fan_out_concurrency, cache=False)
+    return count
+
+
+def bench_list_hosts(server, config, args):
+    from ansible_collections.garnser.privx.plugins.module_utils.client import create_privx_api
+    from ansible_collections.garnser.privx.plugins.module_utils.host_store import PrivXHostStore
+
+    _fresh_process()
+    count = 0
+    for host in PrivXHostStore(create_privx_api(config)).list_hosts():
+        count += 1
+    return count
+
+
+BENCHMARKS = {
+    'add_host': bench_add_host,
+    'privx_hosts': bench_privx_hosts,
+    'role_store': bench_role_store,
+    'authorizer': bench_authorizer,
+    'privx_lookup': bench_privx_lookup,
+    'list_hosts': bench_list_hosts,
+    'get_host': bench_get_host,
+    'fan_out': bench_fan_out,
+}
+
+
+def run_benchmark(name, args):
+    # Each benchmark gets a fresh server so earlier writes do not skew later ones
+    with PrivXStandIn(hosts=args.hosts, roles=args.roles, access_groups=args.access_groups,
+                      latency=args.latency, max_page_size=args.max_page_size,
+                      throttle_rate=args.throttle_rate) as server, \
+            tempfile.TemporaryDirectory(prefix='privx-bench-state-') as state_dir:
+        config = server.config(token_cache_dir=os.path.join(state_dir, 'tokens'))
+        server.reset()
+        tracemalloc.start()
+        start = time.perf_counter()
+        units = BENCHMARKS[name](server, config, args)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        stats = server.stats()
+
+    calls = sum(stats['calls'].values())
+    return {
+        'benchmark': name,
+        'hosts': units,
+        'wall_seconds': round(elapsed, 3),
+        'api_calls': calls,
+        'api_calls_per_host': round(calls / units, 3) if units else None,
+        'calls_by_endpoint': stats['calls'],
+        'bytes_received': stats['bytes_sent'],
+        'peak_memory_mib': round(peak / 1048576.0, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help="Benchmarks to run: %s (default: all)." % ', '.join(sorted(BENCHMARKS)))
+    parser.add_argument('--hosts', type=int, default=1000, help="Hosts on the stand-in (default 1000).")
+    parser.add_argument('--roles', type=int, default=1000, help="Roles on the stand-in (default 1000).")
+    parser.add_argument('--access-groups', type=int, default=50, help="Access groups on the stand-in (default 50).")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every request (default 0).")
+    parser.add_argument('--max-page-size', type=int, default=1000, help="Largest page the stand-in returns (default 1000).")
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help="Fraction of requests the stand-in rejects with 429 (default 0).")
+    parser.add_argument('--tasks', type=int, default=100, help="Hosts handled by per-host benchmarks (default 100).")
+    parser.add_argument('--lookups', type=int, default=20, help="Lookup evaluations in privx_lookup (default 20).")
+    parser.add_argument('--return-details', choices=['none', 'merged', 'fetch'], default='fetch',
+                        help="add_host return_details mode (default fetch).")
+    parser.add_argument('--concurrency', type=int, default=8, help="privx_hosts concurrency (default 8).")
+    parser.add_argument('--fan-out-concurrency', type=int, default=16,
+                        help="Requests in flight in the fan_out benchmark (default 16).")
+    parser.add_argument('--json', metavar='PATH', help="Also write the results as JSON to PATH.")
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error("unknown benchmark: %s" % ', '.join(sorted(unknown)))
+
+    _bootstrap_collection()
+
+    results = []
+    print("%-14s %8s %9s %10s %12s %10s" % ('benchmark', 'hosts', 'wall (s)', 'API calls', 'calls/host', 'peak MiB'))
+    for name in args.benchmarks or sorted(BENCHMARKS):
+        result = run_benchmark(name, args)
+        results.append(result)
+        print("%-14s %8d %9.3f %10d %12s %10.2f" % (
+            name, result['hosts'], result['wall_seconds'], result['api_calls'],
+            result['api_calls_per_host'], result['peak_memory_mib']))
+        print("    " + ", ".join("%s=%d" % item for item in sorted(result['calls_by_endpoint'].items())))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
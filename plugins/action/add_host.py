@@ -0,0 +1,64 @@
+from ansible.module_utils.common.arg_spec import ArgumentSpecValidator
+from ansible.plugins.action import ActionBase
+from ansible.utils.display import Display
+
+from ansible_collections.garnser.privx.plugins.module_utils.privx_utils import define_argument_spec
+from ansible_collections.garnser.privx.plugins.module_utils.client import get_privx_api, HAS_PRIVX
+from ansible_collections.garnser.privx.plugins.module_utils.host_store import add_host, get_add_host_spec
+from ansible_collections.garnser.privx.plugins.module_utils.instrumentation import instrument, get_api_stats
+
+# Role and access group indexes are shared through this directory by all forks on the controller.
+DEFAULT_CONTROLLER_DIRECTORY_CACHE_DIR = '~/.ansible/tmp/privx_directory'
+
+
+class ActionModule(ActionBase):
+    """
+    Run add_host on the controller.
+
+    Instead of shipping the module to the target, every host's task uses the
+    controller's authenticated client, keep-alive connections and role/access
+    group cache. Set run_on_controller to false, or run without the privx_api
+    library on the controller, to execute the module on the target instead.
+    """
+
+    TRANSFERS_FILES = False
+
+    def run(self, tmp=None, task_vars=None):
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        module_args = dict(self._task.args)
+        run_on_controller = module_args.pop('run_on_controller', True)
+        if not run_on_controller or not HAS_PRIVX:
+            if run_on_controller:
+                Display().vvv("privx_api is not available on the controller; running add_host on the target.")
+            result.update(self._execute_module(
+                module_name='garnser.privx.add_host', module_args=module_args, task_vars=task_vars
+            ))
+            return result
+
+        validation = ArgumentSpecValidator(define_argument_spec(get_add_host_spec())).validate(module_args)
+        if validation.error_messages:
+            result.update(failed=True, msg="; ".join(validation.error_messages))
+            return result
+        params = validation.validated_parameters
+        config = params['config']
+        if not config.get('directory_cache_dir'):
+            config['directory_cache_dir'] = DEFAULT_CONTROLLER_DIRECTORY_CACHE_DIR
+
+        try:
+            api = instrument(get_privx_api(config), config.get('api_stats', False))
+        except Exception as e:
+            result.update(failed=True, msg=f"{e}")
+            return result
+
+        result.update(changed=False, failed=False, msg='')
+        if params['host_data']:
+            add_host(api, params, params['host_data'], result, check_mode=self._task.check_mode)
+        else:
+            result.update(failed=True, msg="No host data provided")
+
+        stats = get_api_stats(api)
+        if stats is not None:
+            result['api_stats'] = stats
+        return result
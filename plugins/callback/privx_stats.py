@@ -0,0 +1,116 @@
+DOCUMENTATION = r'''
+name: privx_stats
+type: aggregate
+short_description: Summarizes PrivX API calls made during a play
+description:
+  - Collects the C(api_stats) returned by the PrivX modules when C(config.api_stats) is enabled.
+  - At the end of the playbook, prints per-endpoint call counts, errors, retries, response bytes,
+    TLS handshakes (and how many resumed an earlier session) and latency, followed by the slowest endpoints and the hosts that spent the most time in PrivX API calls.
+author:
+  - Jonathan Petersson (@garnser)
+requirements:
+  - Enable the callback in C(callbacks_enabled) in ansible.cfg.
+options:
+  top:
+    description: Number of endpoints and hosts listed as the slowest.
+    type: int
+    default: 10
+    ini:
+      - section: callback_privx_stats
+        key: top
+    env:
+      - name: PRIVX_STATS_TOP
+'''
+
+from ansible.plugins.callback import CallbackBase
+from ansible_collections.garnser.privx.plugins.module_utils.instrumentation import empty_histogram, LATENCY_BUCKETS_MS
+
+
+def _percentile(histogram, fraction):
+    """Return the upper bound in milliseconds of the bucket holding the given fraction of calls."""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    seen = 0
+    for label in [str(bound) for bound in LATENCY_BUCKETS_MS] + ['inf']:
+        seen += histogram.get(label, 0)
+        if seen >= total * fraction:
+            return label
+    return 'inf'
+
+
+class CallbackModule(CallbackBase):
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'garnser.privx.privx_stats'
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self, display=None):
+        super(CallbackModule, self).__init__(display=display)
+        self.endpoints = {}
+        self.hosts = {}
+
+    def _add(self, host, stats):
+        if not isinstance(stats, dict):
+            return
+        entry = self.hosts.setdefault(host, {'calls': 0, 'total_seconds': 0.0})
+        entry['calls'] += stats.get('calls', 0)
+        entry['total_seconds'] += stats.get('total_seconds', 0.0)
+        for name, endpoint in (stats.get('endpoints') or {}).items():
+            total = self.endpoints.setdefault(name, {
+                'calls': 0, 'errors': 0, 'retries': 0, 'bytes': 0, 'handshakes': 0, 'resumed': 0,
+                'total_seconds': 0.0, 'max_seconds': 0.0, 'histogram': empty_histogram(),
+            })
+            for key in ('calls', 'errors', 'retries', 'bytes', 'handshakes', 'resumed', 'total_seconds'):
+                total[key] += endpoint.get(key, 0)
+            total['max_seconds'] = max(total['max_seconds'], endpoint.get('max_seconds', 0.0))
+            for label, count in (endpoint.get('histogram') or {}).items():
+                total['histogram'][label] = total['histogram'].get(label, 0) + count
+
+    def _collect(self, result):
+        host = result._host.get_name()
+        self._add(host, result._result.get('api_stats'))
+        # Loop results carry their stats per item
+        for item in result._result.get('results') or []:
+            if isinstance(item, dict):
+                self._add(host, item.get('api_stats'))
+
+    def v2_runner_on_ok(self, result):
+        self._collect(result)
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._collect(result)
+
+    def v2_playbook_on_stats(self, stats):
+        if not self.endpoints:
+            return
+        top = self.get_option('top')
+
+        self._display.banner("PRIVX API STATS")
+        self._display.display("%-28s %7s %6s %7s %10s %6s %7s %9s %8s %8s %8s" % (
+            'endpoint', 'calls', 'errors', 'retries', 'bytes', 'tls', 'resumed',
+            'total (s)', 'avg (ms)', 'p95 (ms)', 'max (ms)'))
+        endpoints = sorted(self.endpoints.items(), key=lambda item: -item[1]['total_seconds'])
+        for name, endpoint in endpoints:
+            self._display.display("%-28s %7d %6d %7d %10d %6d %7d %9.3f %8.1f %8s %8.1f" % (
+                name, endpoint['calls'], endpoint['errors'], endpoint['retries'], endpoint['bytes'],
+                endpoint['handshakes'], endpoint['resumed'], endpoint['total_seconds'],
+                1000.0 * endpoint['total_seconds'] / endpoint['calls'] if endpoint['calls'] else 0.0,
+                '<=' + _percentile(endpoint['histogram'], 0.95) if endpoint['calls'] else '-',
+                1000.0 * endpoint['max_seconds']))
+
+        self._display.display("")
+        self._display.display("Slowest endpoints (average latency):")
+        slowest = sorted(
+            ((name, e['total_seconds'] / e['calls']) for name, e in self.endpoints.items() if e['calls']),
+            key=lambda item: -item[1]
+        )
+        for name, average in slowest[:top]:
+            self._display.display("  %-28s %8.1f ms" % (name, 1000.0 * average))
+
+        self._display.display("")
+        self._display.display("Hosts with the most time in PrivX API calls:")
+        hosts = sorted(self.hosts.items(), key=lambda item: -item[1]['total_seconds'])
+        for host, entry in hosts[:top]:
+            self._display.display("  %-40s %9.3f s in %d calls" % (host, entry['total_seconds'], entry['calls']))
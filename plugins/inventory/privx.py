@@ -0,0 +1,265 @@
+DOCUMENTATION = r'''
+name: privx
+short_description: PrivX host inventory source
+description:
+  - Builds inventory from the hosts registered in PrivX.
+  - Hosts are grouped by access group, tag and service.
+  - Supports the Ansible inventory cache, so repeated runs do not download the host list again.
+  - Uses a YAML configuration file that ends with C(privx.yml) or C(privx.yaml).
+author:
+  - Jonathan Petersson (@garnser)
+requirements:
+  - privx_api
+extends_documentation_fragment:
+  - constructed
+  - inventory_cache
+options:
+  plugin:
+    description: Token that ensures this is a source file for the plugin.
+    required: true
+    choices: ['garnser.privx.privx']
+  hostname:
+    description: The hostname of the PrivX instance.
+    required: true
+    env:
+      - name: PRIVX_HOSTNAME
+  hostport:
+    description: The port of the PrivX instance.
+    type: int
+    default: 443
+    env:
+      - name: PRIVX_HOSTPORT
+  ca_cert:
+    description: Path to the CA certificate file or CA certificate string for HTTPS verification.
+    required: true
+    env:
+      - name: PRIVX_CA_CERT
+  oauth_client_id:
+    description: The OAuth client ID for authentication.
+    required: true
+    env:
+      - name: PRIVX_OAUTH_CLIENT_ID
+  oauth_client_secret:
+    description: The OAuth client secret for authentication.
+    required: true
+    env:
+      - name: PRIVX_OAUTH_CLIENT_SECRET
+  api_client_id:
+    description: The API client ID for authentication.
+    required: true
+    env:
+      - name: PRIVX_API_CLIENT_ID
+  api_client_secret:
+    description: The API client secret for authentication.
+    required: true
+    env:
+      - name: PRIVX_API_CLIENT_SECRET
+  token_cache:
+    description: Reuse access tokens cached on the controller.
+    type: bool
+    default: true
+  token_cache_dir:
+    description: Directory holding cached access tokens.
+    type: str
+  max_retries:
+    description: Times a request throttled or failed by PrivX is retried, with exponential backoff or as long as C(Retry-After) asks.
+    type: int
+    default: 3
+  rate_limit:
+    description: Maximum number of PrivX API requests per second. Unlimited when unset.
+    type: float
+  snapshot:
+    description:
+      - Keep a local SQLite snapshot of PrivX hosts and refresh it incrementally, downloading only hosts changed since the previous refresh.
+      - Useful with large host counts when the inventory cache is off or short-lived.
+    type: bool
+    default: false
+  snapshot_path:
+    description: Path of the snapshot database. Defaults to a file per PrivX instance under C(~/.ansible/tmp/privx_snapshots).
+    type: str
+  snapshot_max_age:
+    description: Seconds a snapshot is used without checking PrivX for changes.
+    type: int
+    default: 300
+  page_size:
+    description: Number of hosts requested per page.
+    type: int
+    default: 1000
+  concurrency:
+    description:
+      - Number of host pages requested at once when downloading hosts without a snapshot.
+      - Above 1, hosts are downloaded over the asyncio client, which keeps at most this many pages in memory.
+    type: int
+    default: 1
+  group_by_access_group:
+    description: Add hosts to a C(privx_ag_<name>) group for their access group.
+    type: bool
+    default: true
+  group_by_tags:
+    description: Add hosts to a C(privx_tag_<tag>) group for each of their tags.
+    type: bool
+    default: true
+  group_by_services:
+    description: Add hosts to a C(privx_service_<service>) group for each of their services.
+    type: bool
+    default: true
+'''
+
+EXAMPLES = r'''
+# privx.yml
+plugin: garnser.privx.privx
+hostname: privx.example.com
+ca_cert: /path/to/cert.pem
+oauth_client_id: privx-external
+oauth_client_secret: XXXXXXXX
+api_client_id: XXXXXXXX-XXXX-XXXX-XXXX-XXXXXXXXXXXX
+api_client_secret: XXXXXXXX
+cache: true
+cache_plugin: ansible.builtin.jsonfile
+cache_connection: ~/.ansible/tmp/privx_inventory
+cache_timeout: 3600
+keyed_groups:
+  - key: privx_external_id is not none
+    prefix: managed
+'''
+
+from ansible.errors import AnsibleError
+from ansible.plugins.inventory import BaseInventoryPlugin, Constructable, Cacheable
+
+from ansible_collections.garnser.privx.plugins.module_utils.async_client import create_async_privx_api
+from ansible_collections.garnser.privx.plugins.module_utils.client import get_privx_api
+from ansible_collections.garnser.privx.plugins.module_utils.directory import PrivXDirectory
+from ansible_collections.garnser.privx.plugins.module_utils.host_store import PrivXHostStore
+from ansible_collections.garnser.privx.plugins.module_utils.snapshot import PrivXSnapshot
+
+CONFIG_OPTIONS = (
+    'hostname', 'hostport', 'ca_cert',
+    'oauth_client_id', 'oauth_client_secret',
+    'api_client_id', 'api_client_secret',
+    'token_cache', 'token_cache_dir',
+    'max_retries', 'rate_limit',
+    'snapshot', 'snapshot_path', 'snapshot_max_age',
+)
+
+
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
+
+    NAME = 'garnser.privx.privx'
+
+    def verify_file(self, path):
+        return super(InventoryModule, self).verify_file(path) and path.endswith(('privx.yml', 'privx.yaml'))
+
+    def _iter_hosts(self):
+        """
+        Yield every host reduced to the fields the inventory uses.
+
+        Hosts are downloaded a page at a time as they are consumed, so only
+        one page of full host data is held in memory, or up to concurrency
+        pages when they are requested concurrently.
+        """
+        config = {key: self.get_option(key) for key in CONFIG_OPTIONS}
+        page_size = self.get_option('page_size')
+        concurrency = self.get_option('concurrency') or 1
+        snapshot = None
+        facade = None
+        try:
+            snapshot = PrivXSnapshot.for_config(config)
+            if snapshot is not None:
+                # Only hosts changed since the last refresh are downloaded
+                snapshot.sync(get_privx_api(config))
+                access_groups = {ag.get('id'): ag.get('name') for ag in snapshot.access_groups()}
+                source = snapshot.iter_hosts()
+            elif concurrency > 1:
+                facade = create_async_privx_api(config, concurrency)
+                directory = PrivXDirectory.get(facade, config)
+                access_groups = {ident: name for name, ident in directory.index('access_groups')['names'].items()}
+                source = facade.iter_all('get_hosts', page_size, window=concurrency)
+            else:
+                api = get_privx_api(config)
+                directory = PrivXDirectory.get(api, config)
+                access_groups = {ident: name for name, ident in directory.index('access_groups')['names'].items()}
+                source = PrivXHostStore(api, directory, page_size=page_size).list_hosts()
+            for host in source:
+                yield {
+                    'name': host.get('common_name') or host.get('id'),
+                    'id': host.get('id'),
+                    'external_id': host.get('external_id'),
+                    'addresses': host.get('addresses') or [],
+                    'access_group_id': host.get('access_group_id'),
+                    'access_group': access_groups.get(host.get('access_group_id')),
+                    'tags': host.get('tags') or [],
+                    'services': sorted({s.get('service') for s in host.get('services') or [] if s.get('service')}),
+                }
+        except Exception as e:
+            raise AnsibleError(f"Failed to fetch hosts from PrivX: {e}")
+        finally:
+            if snapshot is not None:
+                snapshot.close()
+            if facade is not None:
+                facade.close()
+
+    def _populate(self, hosts):
+        strict = self.get_option('strict')
+        constructed = any(self.get_option(option) for option in ('compose', 'groups', 'keyed_groups'))
+        by_access_group = self.get_option('group_by_access_group')
+        by_tags = self.get_option('group_by_tags')
+        by_services = self.get_option('group_by_services')
+        for host in hosts:
+            name = self.inventory.add_host(host['name'])
+            hostvars = {
+                'privx_id': host['id'],
+                'privx_external_id': host['external_id'],
+                'privx_addresses': host['addresses'],
+                'privx_access_group': host['access_group'],
+                'privx_access_group_id': host['access_group_id'],
+                'privx_tags': host['tags'],
+                'privx_services': host['services'],
+            }
+            if host['addresses']:
+                hostvars['ansible_host'] = host['addresses'][0]
+            for key, value in hostvars.items():
+                self.inventory.set_variable(name, key, value)
+
+            groups = []
+            if by_access_group and host['access_group']:
+                groups.append('privx_ag_' + host['access_group'])
+            if by_tags:
+                groups.extend('privx_tag_' + tag for tag in host['tags'])
+            if by_services:
+                groups.extend('privx_service_' + service for service in host['services'])
+            for group in groups:
+                group = self.inventory.add_group(self._sanitize_group_name(group))
+                self.inventory.add_child(group, name)
+
+            if not constructed:
+                continue
+            self._set_composite_vars(self.get_option('compose'), hostvars, name, strict=strict)
+            self._add_host_to_composed_groups(self.get_option('groups'), hostvars, name, strict=strict)
+            self._add_host_to_keyed_groups(self.get_option('keyed_groups'), hostvars, name, strict=strict)
+
+    def parse(self, inventory, loader, path, cache=True):
+        super(InventoryModule, self).parse(inventory, loader, path)
+        self._read_config_data(path)
+
+        cache_key = self.get_cache_key(path)
+        user_cache_setting = self.get_option('cache')
+        attempt_to_read_cache = user_cache_setting and cache
+        cache_needs_update = user_cache_setting and not cache
+
+        hosts = None
+        if attempt_to_read_cache:
+            try:
+                hosts = self._cache[cache_key]
+            except KeyError:
+                cache_needs_update = True
+
+        if hosts is None:
+            hosts = self._iter_hosts()
+            # Without a cache to write, hosts go straight from PrivX into the inventory
+            if cache_needs_update:
+                hosts = list(hosts)
+
+        if cache_needs_update:
+            self._cache[cache_key] = hosts
+
+        self._populate(hosts)
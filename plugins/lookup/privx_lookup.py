@@ -1,15 +1,27 @@
-import os
+import copy
 import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from ansible.errors import AnsibleError
 from ansible.plugins.lookup import LookupBase
 from ansible.utils.display import Display
-
-try:
-    import privx_api
-except ImportError:
-    PRIVX_IMP_ERR = traceback.format_exc()
-    HAS_PRIVX = False
+from ansible_collections.garnser.privx.plugins.module_utils.client import get_privx_api, client_key
+from ansible_collections.garnser.privx.plugins.module_utils.async_client import (
+    create_async_privx_api,
+    DEFAULT_CONCURRENCY,
+)
+from ansible_collections.garnser.privx.plugins.module_utils.instrumentation import (
+    instrument,
+    record_responses,
+    InstrumentedPrivXAPI,
+)
+from ansible_collections.garnser.privx.plugins.module_utils.privx_utils import iter_pages
+from ansible_collections.garnser.privx.plugins.module_utils.query import PrivXQuery, LISTING_METHODS
+from ansible_collections.garnser.privx.plugins.module_utils.snapshot import PrivXSnapshot
 
 REQUIRED_CONFIG_KEYS = [
     'hostname', 'hostport', 'ca_cert',
@@ -17,35 +29,91 @@ REQUIRED_CONFIG_KEYS = [
     'api_client_id', 'api_client_secret'
 ]
 
+# Terms without side effects, whose results may be memoized.
+CACHEABLE_TERM_PREFIXES = ('get_', 'search_', 'resolve_', 'query_', 'list_')
+DEFAULT_CACHE_SIZE = 128
+# Seconds a memoized result stays valid unless cache_ttl says otherwise.
+DEFAULT_CACHE_TTL = 60
+# Host search payload keys the snapshot can answer.
+SNAPSHOT_SEARCH_KEYS = ('common_name', 'external_id', 'addresses')
+# Read terms the asyncio client can run once per filter with fan_out; list filters are passed as arguments.
+FAN_OUT_TERMS = ('get_host', 'search_hosts')
+# Built-in terms answered by PrivXQuery, by method and kind: name and ID resolution with pushdown, and projected listings.
+QUERY_TERMS = {
+    'query_roles': ('directory', 'roles'),
+    'query_access_groups': ('directory', 'access_groups'),
+    'query_hosts': ('hosts', None),
+    'list_hosts': ('list_hosts', None),
+}
+
+class TermCache(object):
+    """Size-bounded LRU memo of term results, with an optional TTL; results are copied in and out."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(config, term, filter_arg):
+        return (client_key(config), term, json.dumps(filter_arg, sort_keys=True, default=str))
+
+    def get(self, key, ttl=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if ttl is not None and time.time() - entry[0] >= ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        # Callers may modify results, which must not change the memoized ones
+        return entry[0], copy.deepcopy(entry[1])
+
+    def put(self, key, value, size=DEFAULT_CACHE_SIZE):
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+_TERM_CACHE = TermCache()
+
 def initialize_privx_api(config):
+    """Return the process-wide authenticated client for this config, creating it on first use."""
     privx = None
     try:
-        privx = privx_api.PrivXAPI(
-            config.get('hostname', ''),
-            config.get('hostport', ''),
-            get_certificate_content(config.get('ca_cert', '')),
-            config.get('oauth_client_id', ''),
-            config.get('oauth_client_secret', ''),
-        )
-        try:
-            privx.authenticate(
-                config.get('api_client_id', ''),
-                config.get('api_client_secret', '')
-            )
-        except Exception as e:
-            Display().error(f"Failed to authenticate to the PrivX API: {e} {config.get('api_client_id')} {config.get('api_client_secret')}")
-
+        privx = get_privx_api(config)
     except Exception as e:
-        Display().error(f"Failed to establish connection to PrivX API: {e}")
+        Display().error(f"{e}")
 
     return privx
 
-def get_certificate_content(ca_cert):
-    if os.path.isfile(ca_cert):
-        with open(ca_cert, 'r') as file:
-            return file.read()
+def snapshot_term(snapshot, term, filter_arg):
+    """Answer a term from the local snapshot; returns (handled, data)."""
+    if term == 'get_roles':
+        items = snapshot.roles()
+    elif term == 'get_access_groups':
+        items = snapshot.access_groups()
+    elif term == 'get_hosts' and filter_arg is None:
+        items = list(snapshot.iter_hosts())
+    elif term == 'search_hosts' and isinstance(filter_arg, dict) and set(filter_arg) <= set(SNAPSHOT_SEARCH_KEYS):
+        items = list(snapshot.search_hosts(**filter_arg))
     else:
-        return ca_cert
+        return False, None
+    return True, {'count': len(items), 'items': items}
+
+def positive_int(name, value, default):
+    """Return value as a positive int, or default when unset; raises AnsibleError otherwise."""
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        number = 0
+    if isinstance(value, bool) or number < 1:
+        raise AnsibleError(f"'{name}' must be a positive integer, got '{value}'.")
+    return number
 
 def validate_config(config):
     missing_keys = [key for key in REQUIRED_CONFIG_KEYS if key not in config]
@@ -72,21 +140,184 @@ class LookupModule(LookupBase):
         if privx is None:
             Display().error("PrivX API object initialization failed, check logs for details.")
             return []
+        # The shared client is wrapped per run so each lookup reports its own calls
+        privx = instrument(privx, kwargs.get("api_stats", config.get('api_stats', False)))
 
-        results = []
-        for term in terms:
-            func = getattr(privx, term, None)
-            try:
-                if func and callable(func):
-                    params = inspect.signature(func).parameters
-                    if params and filter_arg is not None:
-                        results.append(func(filter_arg).data)
-                    else:
-                        results.append(func().data)
-                else:
-                    Display().error(f"No such function '{term}' available on PrivX API.")
+        parallel = kwargs.get("parallel", False)
+        if parallel is True:
+            workers = len(terms)
+        elif parallel is False:
+            workers = 1
+        else:
+            workers = positive_int('parallel', parallel, 1)
+        use_cache = kwargs.get("cache", False)
+        cache_ttl = positive_int('cache_ttl', kwargs.get("cache_ttl"), DEFAULT_CACHE_TTL)
+        cache_size = positive_int('cache_size', kwargs.get("cache_size"), DEFAULT_CACHE_SIZE)
+
+        fan_out = kwargs.get("fan_out", False) and isinstance(filter_arg, list)
+        concurrency = positive_int('concurrency', kwargs.get("concurrency"), DEFAULT_CONCURRENCY)
+        async_api = []
+        async_lock = threading.Lock()
+
+        def get_async_api():
+            # One asyncio client per run, shared by all fanned-out terms
+            with async_lock:
+                if not async_api:
+                    async_api.append(create_async_privx_api(config, concurrency))
+                return async_api[0]
+
+        snapshot = None
+        try:
+            snapshot = PrivXSnapshot.for_config(config)
+            if snapshot is not None:
+                snapshot.sync(privx)
+        except Exception as e:
+            Display().warning(f"PrivX snapshot unavailable, using the API: {e}")
+            snapshot = None
+
+        fields = kwargs.get("fields", None)
+
+        def listing(kind):
+            # Whole collections are memoized like terms, so repeated queries reuse one scan
+            key = TermCache.key(config, LISTING_METHODS[kind], '*')
+            entry = _TERM_CACHE.get(key, cache_ttl) if use_cache else None
+            if entry is not None:
+                return entry[1]
+            items = list(iter_pages(getattr(privx, LISTING_METHODS[kind])))
+            if use_cache:
+                _TERM_CACHE.put(key, items, cache_size)
+            return items
+
+        def get_hosts(host_ids):
+            if len(host_ids) == 1:
+                response = privx.get_host(host_ids[0])
+                return {host_ids[0]: response.data if response.ok else None}
+            responses = get_async_api().map('get_host', [(host_id,) for host_id in host_ids])
+            record_responses(privx, 'get_host', responses)
+            return {host_id: r.data if r.ok else None for host_id, r in zip(host_ids, responses)}
+
+        query = PrivXQuery(privx, snapshot, listing=listing, get_hosts=get_hosts)
+
+        def call(term):
+            if term in QUERY_TERMS:
+                return self._query(query, config, term, filter_arg, fields, use_cache, cache_ttl, cache_size)
+            if fan_out:
+                return self._fan_out(get_async_api, privx, config, term, filter_arg, snapshot,
+                                     use_cache, cache_ttl, cache_size)
+            if snapshot is not None:
+                handled, data = snapshot_term(snapshot, term, filter_arg)
+                if handled:
+                    return True, data
+            cacheable = use_cache and term.startswith(CACHEABLE_TERM_PREFIXES)
+            if cacheable:
+                key = TermCache.key(config, term, filter_arg)
+                entry = _TERM_CACHE.get(key, cache_ttl)
+                if entry is not None:
+                    return True, entry[1]
+            ok, data = self._run_term(privx, term, filter_arg)
+            if ok and cacheable:
+                _TERM_CACHE.put(key, data, cache_size)
+            return ok, data
+
+        if workers > 1 and len(terms) > 1:
+            # Results keep the order of the terms
+            with ThreadPoolExecutor(max_workers=min(workers, len(terms))) as executor:
+                outcomes = list(executor.map(call, terms))
+        else:
+            outcomes = [call(term) for term in terms]
+
+        if snapshot is not None:
+            snapshot.close()
+        if async_api:
+            async_api[0].close()
+
+        if isinstance(privx, InstrumentedPrivXAPI):
+            Display().vvv(f"PrivX API calls: {privx.api_stats.summary() or 'none'}")
+
+        return [data for ok, data in outcomes if ok]
+
+    def _query(self, query, config, term, filter_arg, fields, use_cache, cache_ttl, cache_size):
+        """Run a built-in query term; data holds the matching items, projected to fields, and the unmatched references."""
+        if use_cache:
+            key = TermCache.key(config, term, [filter_arg, fields])
+            entry = _TERM_CACHE.get(key, cache_ttl)
+            if entry is not None:
+                return True, entry[1]
+        method, kind = QUERY_TERMS[term]
+        try:
+            if term == 'list_hosts':
+                data = query.list_hosts(fields)
+            elif kind is None:
+                data = getattr(query, method)(filter_arg, fields)
+            else:
+                data = getattr(query, method)(kind, filter_arg, fields)
+        except Exception as e:
+            Display().error(f"Error executing '{term}' with arguments '{filter_arg}': {str(e)}")
+            return False, None
+        if use_cache:
+            _TERM_CACHE.put(key, data, cache_size)
+        return True, data
+
+    def _fan_out(self, get_async_api, privx, config, term, filter_args, snapshot, use_cache, cache_ttl, cache_size):
+        """Run a read term once per filter in filter_args, concurrently; data is the list of results in order."""
+        if term not in FAN_OUT_TERMS:
+            Display().error(f"'{term}' cannot be fanned out; supported terms: {', '.join(FAN_OUT_TERMS)}.")
+            return False, None
+        results = [None] * len(filter_args)
+        pending = []
+        cacheable = use_cache and term.startswith(CACHEABLE_TERM_PREFIXES)
+        for index, filter_arg in enumerate(filter_args):
+            if snapshot is not None:
+                handled, data = snapshot_term(snapshot, term, filter_arg)
+                if handled:
+                    results[index] = data
                     continue
-            except Exception as e:
-                Display().error(f"Error executing '{term}' with arguments '{filter_arg}': {str(e)}")
+            if cacheable:
+                entry = _TERM_CACHE.get(TermCache.key(config, term, filter_arg), cache_ttl)
+                if entry is not None:
+                    results[index] = entry[1]
+                    continue
+            pending.append(index)
+        if not pending:
+            return True, results
+
+        try:
+            async_api = get_async_api()
+            responses = async_api.map(term, [
+                filter_args[index] if isinstance(filter_args[index], (list, tuple)) else (filter_args[index],)
+                for index in pending
+            ])
+        except Exception as e:
+            Display().error(f"Error executing '{term}' for {len(pending)} filters: {str(e)}")
+            return False, None
+        record_responses(privx, term, responses)
+
+        failed = [(index, response) for index, response in zip(pending, responses) if not response.ok]
+        for index, response in failed:
+            Display().error(
+                f"Error executing '{term}' with arguments '{filter_args[index]}': "
+                f"status {response.status}: {response.data}"
+            )
+        if failed:
+            return False, None
+
+        for index, response in zip(pending, responses):
+            results[index] = response.data
+            if cacheable:
+                _TERM_CACHE.put(TermCache.key(config, term, filter_args[index]), response.data, cache_size)
+        return True, results
 
-        return results
+    def _run_term(self, privx, term, filter_arg):
+        func = getattr(privx, term, None)
+        try:
+            if func and callable(func):
+                params = inspect.signature(func).parameters
+                if params and filter_arg is not None:
+                    return True, func(filter_arg).data
+                else:
+                    return True, func().data
+            else:
+                Display().error(f"No such function '{term}' available on PrivX API.")
+        except Exception as e:
+            Display().error(f"Error executing '{term}' with arguments '{filter_arg}': {str(e)}")
+        return False, None
@@ -0,0 +1,455 @@
+import asyncio
+import base64
+import collections
+import functools
+import http.client
+import json
+import threading
+import time
+import urllib.parse
+
+from ansible_collections.garnser.privx.plugins.module_utils.client import (
+    _POOL,
+    get_certificate_content,
+    note_handshake,
+    DEFAULT_IDLE_TIMEOUT,
+)
+from ansible_collections.garnser.privx.plugins.module_utils.governor import (
+    get_governor,
+    note_retries,
+    parse_retry_after,
+    IDEMPOTENT_PREFIXES,
+    GATEWAY_STATUSES,
+    THROTTLED_STATUSES,
+)
+from ansible_collections.garnser.privx.plugins.module_utils.token_cache import authenticate_privx_api
+
+# Requests in flight at once per client.
+DEFAULT_CONCURRENCY = 16
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_REQUEST_TIMEOUT = 60
+
+OAUTH_TOKEN_PATH = '/auth/api/v1/oauth/token'
+ROLES_PATH = '/role-store/api/v1/roles'
+ACCESS_GROUPS_PATH = '/authorizer/api/v1/accessgroups'
+HOSTS_PATH = '/host-store/api/v1/hosts'
+HOSTS_SEARCH_PATH = '/host-store/api/v1/hosts/search'
+
+# Asynchronous methods exposed by the sync facade, all with the privx_api signatures.
+FACADE_METHODS = (
+    'authenticate', 'get_roles', 'get_access_groups', 'get_hosts', 'search_hosts',
+    'get_host', 'create_host', 'update_host', 'delete_host',
+)
+
+
+class PrivXAsyncResponse(object):
+    """Response with the interface of privx_api's PrivXAPIResponse."""
+
+    def __init__(self, status, raw, expected_status, retries=0, seconds=0.0, handshakes=0, resumed=0):
+        self._status = status
+        self._ok = status == expected_status
+        try:
+            self._data = json.loads(raw) if raw else {}
+        except ValueError:
+            self._data = {'details': raw.decode('utf-8', 'replace')}
+        self.retries = retries
+        self.seconds = seconds
+        self.size = len(raw or b'')
+        self.handshakes = handshakes
+        self.resumed = resumed
+
+    @property
+    def ok(self):
+        return self._ok
+
+    @property
+    def data(self):
+        return self._data
+
+    @property
+    def status(self):
+        return self._status
+
+
+class _Connection(object):
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.idle_since = None
+        # Whether the TLS handshake of this connection is still to be reported, and how it went
+        self.new = True
+        ssl_object = writer.get_extra_info('ssl_object')
+        self.session_reused = bool(ssl_object is not None and ssl_object.session_reused)
+
+    def close(self):
+        self.writer.close()
+
+
+async def _read_response(reader):
+    """Read one HTTP/1.1 response; returns (status, headers, body)."""
+    line = await reader.readline()
+    if not line:
+        raise http.client.RemoteDisconnected("Remote end closed connection without response")
+    try:
+        status = int(line.split(None, 2)[1])
+    except (IndexError, ValueError):
+        raise http.client.BadStatusLine(line.decode('latin-1', 'replace').strip())
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if status in (204, 304) or 100 <= status < 200:
+        body = b''
+    elif 'chunked' in headers.get('transfer-encoding', '').lower():
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0].strip() or b'0', 16)
+            if not size:
+                # Trailers end with an empty line
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        body = b''.join(chunks)
+    elif 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    else:
+        headers['connection'] = 'close'
+        body = await reader.read()
+    return status, headers, body
+
+
+class PrivXAsyncClient(object):
+    """
+    asyncio client for the PrivX endpoints used by the collection.
+
+    Requests share keep-alive connections, at most concurrency of them in
+    flight at once, and follow the retry, rate limit and circuit breaker
+    policy of the governor they are given. Method names, arguments and
+    responses match privx_api.PrivXAPI.
+    """
+
+    def __init__(self, hostname, hostport, ca_cert, oauth_client_id, oauth_client_secret,
+                 concurrency=DEFAULT_CONCURRENCY, governor=None, timeout=DEFAULT_REQUEST_TIMEOUT):
+        self._access_token = ''
+        self._oauth_client_id = oauth_client_id
+        self._oauth_client_secret = oauth_client_secret
+        self.hostname = hostname
+        self.hostport = int(hostport) if hostport else 443
+        self.ca_cert = ca_cert
+        self.concurrency = concurrency
+        self.governor = governor
+        self.timeout = timeout
+        self._idle = []
+        self._semaphore = None
+
+    def _headers(self):
+        return {
+            'Content-Type': 'application/json',
+            'Authorization': 'Bearer {}'.format(self._access_token),
+        }
+
+    async def _connect(self):
+        while self._idle:
+            conn = self._idle.pop()
+            if time.monotonic() - conn.idle_since <= DEFAULT_IDLE_TIMEOUT and not conn.reader.at_eof():
+                return conn, True
+            conn.close()
+        reader, writer = await asyncio.open_connection(
+            self.hostname, self.hostport,
+            ssl=_POOL.get_context(self.ca_cert), server_hostname=self.hostname,
+        )
+        return _Connection(reader, writer), False
+
+    def _release(self, conn):
+        if len(self._idle) < self.concurrency:
+            conn.idle_since = time.monotonic()
+            self._idle.append(conn)
+        else:
+            conn.close()
+
+    async def _send(self, method, path, body, headers):
+        lines = ['%s %s HTTP/1.1' % (method, path), 'Host: %s:%d' % (self.hostname, self.hostport)]
+        lines.extend('%s: %s' % item for item in headers.items())
+        lines.append('Content-Length: %d' % len(body))
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+        while True:
+            conn, reused = await self._connect()
+            try:
+                conn.writer.write(request)
+                await conn.writer.drain()
+                status, response_headers, raw = await _read_response(conn.reader)
+                handshake = (1, 1 if conn.session_reused else 0) if conn.new else (0, 0)
+                conn.new = False
+            except (OSError, http.client.HTTPException, asyncio.IncompleteReadError):
+                conn.close()
+                if reused:
+                    # The server closed the idle connection; try a fresh one
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            if response_headers.get('connection', '').lower() == 'close':
+                conn.close()
+            else:
+                self._release(conn)
+            return status, response_headers, raw, handshake
+
+    async def _request(self, name, method, path, expected_status, query=None, body=None, headers=None):
+        if query:
+            query = {key: value for key, value in query.items() if value is not None}
+            if query:
+                path += '?' + urllib.parse.urlencode(query)
+        if body is None:
+            data = b''
+        elif isinstance(body, bytes):
+            data = body
+        else:
+            data = json.dumps(body).encode('utf-8')
+        headers = headers or self._headers()
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        governor = self.governor
+        idempotent = name.startswith(IDEMPOTENT_PREFIXES)
+        attempt = 0
+        start = time.perf_counter()
+        handshakes = [0, 0]
+
+        def respond():
+            return PrivXAsyncResponse(status, raw, expected_status, attempt, time.perf_counter() - start, *handshakes)
+
+        while True:
+            if governor is not None:
+                governor.breaker.before_call()
+                wait = governor.bucket.reserve()
+                while wait:
+                    await asyncio.sleep(wait)
+                    wait = governor.bucket.reserve()
+            status, error, retry_after = None, None, None
+            try:
+                async with self._semaphore:
+                    status, response_headers, raw, handshake = await asyncio.wait_for(
+                        self._send(method, path, data, headers), self.timeout
+                    )
+                handshakes[0] += handshake[0]
+                handshakes[1] += handshake[1]
+            except (OSError, http.client.HTTPException, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                error = e
+            else:
+                retry_after = response_headers.get('retry-after')
+                if status not in THROTTLED_STATUSES + GATEWAY_STATUSES:
+                    if governor is not None:
+                        governor.breaker.success()
+                    return respond()
+
+            if governor is None:
+                if error is not None:
+                    raise error
+                return respond()
+            governor.breaker.failure()
+            retryable = status in THROTTLED_STATUSES or idempotent
+            if attempt >= governor.max_retries or not retryable:
+                if error is not None:
+                    raise error
+                return respond()
+            await asyncio.sleep(governor.delay(attempt, parse_retry_after(retry_after)))
+            attempt += 1
+
+    async def authenticate(self, username, password):
+        credentials = '{}:{}'.format(self._oauth_client_id, self._oauth_client_secret)
+        response = await self._request(
+            'authenticate', 'POST', OAUTH_TOKEN_PATH, 200,
+            body=urllib.parse.urlencode({
+                'grant_type': 'password',
+                'username': username,
+                'password': password,
+            }).encode('utf-8'),
+            headers={
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'Authorization': 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii'),
+            },
+        )
+        if not response.ok:
+            raise Exception("Invalid response: ", response.status)
+        self._access_token = response.data.get('access_token')
+
+    async def get_roles(self):
+        return await self._request('get_roles', 'GET', ROLES_PATH, 200)
+
+    async def get_access_groups(self, offset=None, limit=None, sort_key=None, sort_dir=None):
+        return await self._request('get_access_groups', 'GET', ACCESS_GROUPS_PATH, 200, query={
+            'offset': offset, 'limit': limit, 'sortkey': sort_key, 'sortdir': sort_dir,
+        })
+
+    async def get_hosts(self, offset=None, limit=None, sort_key=None, sort_dir=None, filter_param=None):
+        return await self._request('get_hosts', 'GET', HOSTS_PATH, 200, query={
+            'offset': offset, 'limit': limit, 'sortkey': sort_key, 'sortdir': sort_dir, 'filter': filter_param,
+        })
+
+    async def search_hosts(self, search_payload=None, offset=None, limit=None, sort_key=None, sort_dir=None,
+                           filter_param=None):
+        return await self._request('search_hosts', 'POST', HOSTS_SEARCH_PATH, 200, query={
+            'offset': offset, 'limit': limit, 'sortkey': sort_key, 'sortdir': sort_dir, 'filter': filter_param,
+        }, body=search_payload or {})
+
+    async def get_host(self, host_id):
+        return await self._request('get_host', 'GET', '%s/%s' % (HOSTS_PATH, host_id), 200)
+
+    async def create_host(self, host):
+        return await self._request('create_host', 'POST', HOSTS_PATH, 201, body=host)
+
+    async def update_host(self, host_id, host):
+        return await self._request('update_host', 'PUT', '%s/%s' % (HOSTS_PATH, host_id), 200, body=host)
+
+    async def delete_host(self, host_id):
+        return await self._request('delete_host', 'DELETE', '%s/%s' % (HOSTS_PATH, host_id), 200)
+
+    async def gather(self, name, calls):
+        """Call one method for each args tuple in calls concurrently; responses keep the order of calls."""
+        method = getattr(self, name)
+        return await asyncio.gather(*[method(*args) for args in calls])
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+def _page_items(response):
+    if not response.ok:
+        raise Exception("PrivX API request failed with status {}: {}".format(response.status, response.data))
+    return (response.data or {}).get('items') or []
+
+
+class PrivXSyncFacade(object):
+    """
+    Blocking interface to a PrivXAsyncClient for synchronous callers.
+
+    The client runs on an event loop in a background thread. The facade has
+    the privx_api.PrivXAPI method names and signatures, so it can be used with
+    the token cache, directory, host store and instrumentation like the SDK
+    client; map() and iter_all() expose the concurrent calls.
+    """
+
+    def __init__(self, client):
+        object.__setattr__(self, '_privx_client', client)
+        object.__setattr__(self, '_privx_loop', asyncio.new_event_loop())
+        thread = threading.Thread(target=self._privx_loop.run_forever, name='privx-async', daemon=True)
+        object.__setattr__(self, '_privx_thread', thread)
+        thread.start()
+
+    def run(self, coroutine):
+        """Run a coroutine on the client's event loop and return its result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._privx_loop).result()
+
+    def _call(self, coroutine):
+        return self._noted(self.run(coroutine))
+
+    def _noted(self, response):
+        # Retries happened on the loop thread; report them on the calling one
+        if getattr(response, 'retries', 0):
+            note_retries(response.retries)
+        for index in range(getattr(response, 'handshakes', 0)):
+            note_handshake(index < response.resumed)
+        return response
+
+    def __getattr__(self, name):
+        client = self._privx_client
+        if name not in FACADE_METHODS:
+            return getattr(client, name)
+        method = getattr(client, name)
+
+        @functools.wraps(method)
+        def call(*args, **kwargs):
+            return self._call(method(*args, **kwargs))
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._privx_client, name, value)
+
+    def map(self, name, calls):
+        """Call one method for each args tuple in calls concurrently and return the responses in order."""
+        responses = self.run(self._privx_client.gather(name, [tuple(args) for args in calls]))
+        retries = sum(getattr(response, 'retries', 0) for response in responses)
+        if retries:
+            note_retries(retries)
+        return responses
+
+    def iter_all(self, name, page_size=DEFAULT_PAGE_SIZE, window=None, **kwargs):
+        """
+        Yield all items of a paged listing in order, fetching up to window pages concurrently.
+
+        The first page gives the total count, from which later pages are
+        requested ahead of the consumer, at most window at a time; memory use
+        is bounded by window pages however long the listing is.
+        """
+        client = self._privx_client
+        method = getattr(client, name)
+        window = max(1, window or client.concurrency)
+        first = self._call(method(offset=0, limit=page_size, **kwargs))
+        items = _page_items(first)
+        count = (first.data or {}).get('count', len(items))
+        # The server may cap the page size below the one asked for
+        step = len(items) if 0 < len(items) < page_size else page_size
+        offsets = iter(range(len(items), count, step) if items else ())
+        pending = collections.deque()
+        try:
+            while True:
+                # Later pages are requested before the current one is handed out
+                while len(pending) < window:
+                    offset = next(offsets, None)
+                    if offset is None:
+                        break
+                    pending.append(asyncio.run_coroutine_threadsafe(
+                        method(offset=offset, limit=step, **kwargs), self._privx_loop
+                    ))
+                for item in items:
+                    yield item
+                if not pending:
+                    return
+                items = _page_items(self._noted(pending.popleft().result()))
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        loop = self._privx_loop
+        if loop.is_closed():
+            return
+        self.run(self._privx_client.close())
+        loop.call_soon_threadsafe(loop.stop)
+        self._privx_thread.join()
+        loop.close()
+
+
+def create_async_privx_api(config, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Return an authenticated PrivXSyncFacade for a config dict, for controller-side plugins.
+
+    Requests follow the governor shared by this process and authentication
+    goes through the token cache, like create_privx_api().
+    """
+    facade = PrivXSyncFacade(PrivXAsyncClient(
+        config.get('hostname', ''),
+        config.get('hostport', ''),
+        get_certificate_content(config.get('ca_cert', '')),
+        config.get('oauth_client_id', ''),
+        config.get('oauth_client_secret', ''),
+        concurrency=concurrency,
+        governor=get_governor(config),
+    ))
+    try:
+        authenticate_privx_api(facade, config)
+    except Exception as e:
+        facade.close()
+        raise Exception(f"Failed to authenticate to the PrivX API: {e}")
+    return facade
@@ -0,0 +1,341 @@
+import hashlib
+import http.client
+import json
+import os
+import select
+import ssl
+import stat
+import threading
+import time
+
+from ansible_collections.garnser.privx.plugins.module_utils.governor import govern, note_retry_after
+from ansible_collections.garnser.privx.plugins.module_utils.token_cache import (
+    authenticate_privx_api,
+    token_expiry,
+    DEFAULT_REFRESH_MARGIN,
+)
+
+HAS_PRIVX = True
+
+try:
+    import privx_api
+except ImportError:
+    HAS_PRIVX = False
+
+DEFAULT_POOL_SIZE = 8
+# Idle keep-alive connections older than this are not reused.
+DEFAULT_IDLE_TIMEOUT = 30
+
+# Authenticated clients shared by controller-side plugins, keyed by client_key().
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+# Response body bytes read through pooled connections, per thread.
+_RECEIVED = threading.local()
+# TLS handshakes made by pooled connections, per thread.
+_HANDSHAKES = threading.local()
+
+# CA bundles read from disk, keyed by path; re-read when the file changes.
+_CERTIFICATES = {}
+_CERTIFICATES_LOCK = threading.Lock()
+
+
+def get_certificate_content(ca_cert):
+    """Return the PEM content of ca_cert, a path or the PEM itself; files are read once per change."""
+    try:
+        st = os.stat(ca_cert)
+    except (OSError, ValueError):
+        return ca_cert
+    if not stat.S_ISREG(st.st_mode):
+        return ca_cert
+    with _CERTIFICATES_LOCK:
+        entry = _CERTIFICATES.get(ca_cert)
+        if entry is None or entry[0] != (st.st_mtime_ns, st.st_size):
+            with open(ca_cert, 'r') as file:
+                entry = _CERTIFICATES[ca_cert] = ((st.st_mtime_ns, st.st_size), file.read())
+        return entry[1]
+
+
+def received_bytes():
+    """Return the response body bytes read through pooled connections by this thread so far."""
+    return getattr(_RECEIVED, 'bytes', 0)
+
+
+def tls_handshakes():
+    """Return the TLS handshakes made by this thread so far, as (total, resumed)."""
+    return getattr(_HANDSHAKES, 'total', 0), getattr(_HANDSHAKES, 'resumed', 0)
+
+
+def note_handshake(resumed):
+    """Count a TLS handshake made on this thread."""
+    _HANDSHAKES.total = tls_handshakes()[0] + 1
+    _HANDSHAKES.resumed = tls_handshakes()[1] + (1 if resumed else 0)
+
+
+def client_key(config):
+    """Return the connection identity of a config dict: instance, CA and both clients."""
+    identity = [
+        config.get('hostname', ''),
+        str(config.get('hostport', '')),
+        config.get('ca_cert', ''),
+        config.get('oauth_client_id', ''),
+        config.get('oauth_client_secret', ''),
+        config.get('api_client_id', ''),
+        config.get('api_client_secret', ''),
+    ]
+    return hashlib.sha256(json.dumps(identity).encode('utf-8')).hexdigest()
+
+
+class _PooledHTTPResponse(http.client.HTTPResponse):
+    """Response that hands its connection back to the pool once the body has been read."""
+
+    _privx_release = None
+
+    def read(self, amt=None):
+        data = super(_PooledHTTPResponse, self).read(amt)
+        _RECEIVED.bytes = received_bytes() + len(data)
+        return data
+
+    def _close_conn(self):
+        super(_PooledHTTPResponse, self)._close_conn()
+        release, self._privx_release = self._privx_release, None
+        if release:
+            release()
+
+
+class _PooledHTTPSConnection(http.client.HTTPSConnection):
+
+    response_class = _PooledHTTPResponse
+
+    def __init__(self, *args, **kwargs):
+        self.pool = kwargs.pop('pool', None)
+        self.pool_key = kwargs.pop('pool_key', None)
+        super(_PooledHTTPSConnection, self).__init__(*args, **kwargs)
+        self.last_response = None
+        self.idle_since = None
+        self.session_reused = None
+
+    def connect(self):
+        # As HTTPSConnection.connect, but offering the last TLS session of this endpoint for resumption
+        http.client.HTTPConnection.connect(self)
+        session = self.pool.get_session(self.pool_key) if self.pool is not None else None
+        self.sock = self._context.wrap_socket(
+            self.sock, server_hostname=self._tunnel_host or self.host, session=session
+        )
+        self.session_reused = self.sock.session_reused
+        if self.pool is not None:
+            self.pool.note_handshake(self.session_reused)
+        note_handshake(self.session_reused)
+
+    def getresponse(self):
+        self.last_response = super(_PooledHTTPSConnection, self).getresponse()
+        # The SDK drops response headers; keep the one the governor needs
+        note_retry_after(self.last_response.getheader('Retry-After'))
+        # TLS 1.3 session tickets arrive with the first response
+        if self.pool is not None and self.sock is not None:
+            self.pool.save_session(self.pool_key, self.sock.session)
+        return self.last_response
+
+    def is_reusable(self, idle_timeout):
+        if time.time() - self.idle_since > idle_timeout:
+            return False
+        if self.sock is None:
+            # Closed after a 'Connection: close' response; reconnects on use.
+            return True
+        try:
+            # A readable idle socket means the server closed it or sent garbage.
+            return not select.select([self.sock], [], [], 0)[0]
+        except (OSError, ValueError):
+            return False
+
+
+class PrivXConnectionPool(object):
+    """
+    Bounded process-wide pool of keep-alive HTTPS connections per PrivX endpoint.
+
+    One SSL context is built per CA bundle, and new connections resume the
+    last TLS session of their endpoint instead of making a full handshake.
+    Sessions survive forks, so workers resume sessions of their parent.
+    """
+
+    def __init__(self, maxsize=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.created = 0
+        self.reused = 0
+        self.handshakes = 0
+        self.resumed = 0
+        self._idle = {}
+        self._contexts = {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        # Connections inherited from the parent process must not be shared with it.
+        if self._pid != os.getpid():
+            self._idle = {}
+            self._pid = os.getpid()
+
+    def get_context(self, ca_cert):
+        with self._lock:
+            context = self._contexts.get(ca_cert)
+            if context is None:
+                context = self._contexts[ca_cert] = ssl.create_default_context(cadata=ca_cert)
+            return context
+
+    def get_session(self, key):
+        with self._lock:
+            return self._sessions.get(key)
+
+    def save_session(self, key, session):
+        if session is None:
+            return
+        with self._lock:
+            self._sessions[key] = session
+
+    def note_handshake(self, resumed):
+        with self._lock:
+            self.handshakes += 1
+            self.resumed += 1 if resumed else 0
+
+    def acquire(self, host, port, ca_cert):
+        key = (host, port, ca_cert)
+        with self._lock:
+            self._check_fork()
+            idle = self._idle.get(key, [])
+            while idle:
+                conn = idle.pop()
+                if conn.is_reusable(self.idle_timeout):
+                    self.reused += 1
+                    return key, conn
+                conn.close()
+            self.created += 1
+        return key, _PooledHTTPSConnection(
+            host, port=port, context=self.get_context(ca_cert), pool=self, pool_key=key
+        )
+
+    def release(self, key, conn):
+        with self._lock:
+            self._check_fork()
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxsize:
+                conn.idle_since = time.time()
+                conn.last_response = None
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+_POOL = PrivXConnectionPool()
+
+
+class PooledConnection(object):
+    """
+    Drop-in replacement for the privx_api Connection context manager.
+
+    Instead of opening and closing an HTTPS connection per request, connections
+    are taken from and returned to the process-wide pool.
+    """
+
+    def __init__(self, connection_info):
+        self.host = connection_info["host"]
+        self.port = connection_info["port"]
+        self.ca_cert = connection_info["ca_cert"]
+        self._key = None
+        self._connection = None
+
+    def __enter__(self):
+        self._key, self._connection = _POOL.acquire(self.host, self.port, self.ca_cert)
+        return self._connection
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        conn, key = self._connection, self._key
+        response = conn.last_response
+        if exc_type is not None:
+            conn.close()
+        elif response is None or response.isclosed():
+            _POOL.release(key, conn)
+        else:
+            # The SDK reads the body after leaving the with-block.
+            response._privx_release = lambda: _POOL.release(key, conn)
+
+    def get_context(self):
+        return _POOL.get_context(self.ca_cert)
+
+
+def enable_connection_pool(maxsize=DEFAULT_POOL_SIZE):
+    """
+    Route privx_api requests in this process through the keep-alive pool.
+
+    Returns False if the installed privx_api does not open connections through
+    a Connection class, in which case requests are left untouched.
+    """
+    _POOL.maxsize = maxsize
+    base = getattr(privx_api, 'base', None) if HAS_PRIVX else None
+    if base is None or not hasattr(base, 'Connection'):
+        return False
+    base.Connection = PooledConnection
+    return True
+
+
+def create_privx_api(config):
+    """
+    Return an authenticated privx_api.PrivXAPI object for a config dict, for controller-side plugins.
+
+    Calls are sent through the request governor shared by this process.
+    """
+    if not HAS_PRIVX:
+        raise Exception("The privx_api Python library is required.")
+    try:
+        privx = govern(privx_api.PrivXAPI(
+            config.get('hostname', ''),
+            config.get('hostport', ''),
+            get_certificate_content(config.get('ca_cert', '')),
+            config.get('oauth_client_id', ''),
+            config.get('oauth_client_secret', ''),
+        ), config)
+    except Exception as e:
+        raise Exception(f"Failed to establish connection to PrivX API: {e}")
+    try:
+        authenticate_privx_api(privx, config)
+    except Exception as e:
+        raise Exception(f"Failed to authenticate to the PrivX API: {e}")
+    return privx
+
+
+def get_privx_api(config):
+    """
+    Return the shared authenticated client for a config dict.
+
+    Clients live for the lifetime of the controller process and are
+    re-authenticated shortly before their access token expires.
+    """
+    if config.get('connection_pool', True):
+        enable_connection_pool(config.get('pool_size') or DEFAULT_POOL_SIZE)
+
+    key = client_key(config)
+    with _CLIENTS_LOCK:
+        entry = _CLIENTS.get(key)
+        if entry is None:
+            privx = create_privx_api(config)
+        elif entry['expires_at'] - DEFAULT_REFRESH_MARGIN <= time.time():
+            privx = entry['api']
+            try:
+                authenticate_privx_api(privx, config)
+            except Exception as e:
+                raise Exception(f"Failed to authenticate to the PrivX API: {e}")
+        else:
+            return entry['api']
+        _CLIENTS[key] = {
+            'api': privx,
+            'expires_at': token_expiry(getattr(privx, '_access_token', '') or ''),
+        }
+        return privx
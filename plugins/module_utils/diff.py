@@ -0,0 +1,106 @@
+# List fields whose order carries no meaning in PrivX, mapped to the keys
+# identifying their elements (None for lists of plain values).
+HOST_LIST_KEYS = {
+    'addresses': None,
+    'tags': None,
+    'ssh_host_public_keys': None,
+    'roles': ('id',),
+    'services': ('service', 'address', 'port'),
+    'principals': ('principal', 'passphrase', 'use_user_account', 'source'),
+}
+
+
+def identity(item, keys):
+    """Return the identity of a list element; empty strings and missing keys are the same."""
+    if not isinstance(item, dict):
+        return item
+    return tuple(None if item.get(k) == '' else item.get(k) for k in keys)
+
+
+def canonical(value, field=None, list_keys=HOST_LIST_KEYS):
+    """Return a hashable form of a value in which unordered lists compare equal regardless of order."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, canonical(v, k, list_keys)) for k, v in value.items() if v is not None))
+    if isinstance(value, list):
+        items = [canonical(v, None, list_keys) for v in value]
+        if field in list_keys:
+            return ('unordered',) + tuple(sorted(items, key=repr))
+        return tuple(items)
+    return value
+
+
+def _index(items, keys):
+    index = {}
+    for item in items:
+        index.setdefault(identity(item, keys), item)
+    return index if len(index) == len(items) else None
+
+
+def diff_values(old, new, field=None, list_keys=HOST_LIST_KEYS):
+    """
+    Return a minimal nested diff from old to new, or None if they are equivalent.
+
+    Dicts are compared key by key and keys set to None count as missing.
+    Lists named in list_keys are compared as sets: keyed lists report
+    'added', 'removed' and per-element 'changed' entries, other lists
+    'added' and 'removed' values. Anything else is reported as old/new.
+    """
+    if canonical(old, field, list_keys) == canonical(new, field, list_keys):
+        return None
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        result = {}
+        for key in list(old) + [k for k in new if k not in old]:
+            sub = diff_values(old.get(key), new.get(key), key, list_keys)
+            if sub is not None:
+                result[key] = sub
+        return result or None
+
+    if isinstance(old, list) and isinstance(new, list) and field in list_keys:
+        keys = list_keys[field]
+        old_index = _index(old, keys) if keys else None
+        new_index = _index(new, keys) if keys else None
+        if old_index is not None and new_index is not None:
+            changed = {}
+            for ident in old_index.keys() & new_index.keys():
+                sub = diff_values(old_index[ident], new_index[ident], None, list_keys)
+                if sub is not None:
+                    changed['/'.join('' if k is None else str(k) for k in ident)] = sub
+            result = {
+                'added': [item for ident, item in new_index.items() if ident not in old_index],
+                'removed': [item for ident, item in old_index.items() if ident not in new_index],
+                'changed': changed,
+            }
+        else:
+            old_set = {canonical(item, None, list_keys) for item in old}
+            new_set = {canonical(item, None, list_keys) for item in new}
+            result = {
+                'added': [item for item in new if canonical(item, None, list_keys) not in old_set],
+                'removed': [item for item in old if canonical(item, None, list_keys) not in new_set],
+            }
+        return {k: v for k, v in result.items() if v} or None
+
+    return {'old': old, 'new': new}
+
+
+def merge_keyed(existing, new, keys, replace_if):
+    """
+    Merge two lists of dicts by identity in linear time.
+
+    Elements of new that are missing from existing are appended; matching
+    elements are replaced when replace_if(existing_item, new_item) is true.
+    Existing elements keep their position.
+    """
+    merged = list(existing)
+    positions = {}
+    for i, item in enumerate(merged):
+        positions.setdefault(identity(item, keys), i)
+    for item in new:
+        ident = identity(item, keys)
+        i = positions.get(ident)
+        if i is None:
+            positions[ident] = len(merged)
+            merged.append(item)
+        elif replace_if(merged[i], item):
+            merged[i] = item
+    return merged
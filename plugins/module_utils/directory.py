@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+import time
+
+from ansible_collections.garnser.privx.plugins.module_utils.privx_utils import iter_pages, DEFAULT_PAGE_SIZE
+from ansible_collections.garnser.privx.plugins.module_utils.token_cache import token_cache_key
+
+DEFAULT_DIRECTORY_TTL = 300
+
+# Shared directories, keyed by PrivX instance and client identity.
+_DIRECTORIES = {}
+_DIRECTORIES_LOCK = threading.Lock()
+
+
+def _match(entry, ref):
+    """Return the ID matching a reference given as a name/ID string or as a {'name'/'id'} dict."""
+    if isinstance(ref, dict):
+        name, ident = ref.get('name'), ref.get('id')
+    else:
+        name = ident = ref
+    if name is not None and name in entry['names']:
+        return entry['names'][name]
+    if ident is not None and ident in entry['ids']:
+        return ident
+    return None
+
+
+class PrivXDirectory(object):
+    """Indexed, TTL-cached view of PrivX roles and access groups."""
+
+    KINDS = {
+        'roles': ('get_roles', 'role'),
+        'access_groups': ('get_access_groups', 'access group'),
+    }
+
+    def __init__(self, api, key=None, ttl=DEFAULT_DIRECTORY_TTL, cache_dir=None, page_size=DEFAULT_PAGE_SIZE):
+        self.api = api
+        self.key = key
+        self.ttl = ttl
+        self.cache_dir = os.path.expanduser(cache_dir) if cache_dir else None
+        self.page_size = page_size
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, api, config=None):
+        """
+        Return the directory shared by everything talking to the same PrivX instance.
+
+        Without a config the directory is attached to the API object itself.
+        """
+        if config is None:
+            directory = getattr(api, '_privx_directory', None)
+            if directory is None:
+                directory = cls(api)
+                api._privx_directory = directory
+            return directory
+
+        key = token_cache_key(config)
+        with _DIRECTORIES_LOCK:
+            directory = _DIRECTORIES.get(key)
+            if directory is None:
+                ttl = config.get('directory_cache_ttl')
+                directory = cls(
+                    api, key,
+                    ttl=DEFAULT_DIRECTORY_TTL if ttl is None else ttl,
+                    cache_dir=config.get('directory_cache_dir'),
+                )
+                _DIRECTORIES[key] = directory
+            else:
+                directory.api = api
+        return directory
+
+    def _expired(self, entry):
+        return time.time() - entry['fetched_at'] >= self.ttl
+
+    def _cache_path(self, kind):
+        if not self.cache_dir or not self.key:
+            return None
+        return os.path.join(self.cache_dir, '%s.%s.json' % (self.key, kind))
+
+    @staticmethod
+    def _build(fetched_at, items):
+        return {
+            'fetched_at': fetched_at,
+            'names': {name: ident for ident, name in items},
+            'ids': {ident for ident, name in items},
+            'items': items,
+        }
+
+    def _load(self, kind):
+        path = self._cache_path(kind)
+        if path is None:
+            return None
+        try:
+            with open(path, 'r') as f:
+                cached = json.load(f)
+            entry = self._build(cached['fetched_at'], [tuple(item) for item in cached['items']])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return None if self._expired(entry) else entry
+
+    def _save(self, kind, entry):
+        path = self._cache_path(kind)
+        if path is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+            tmp_path = '%s.%d.tmp' % (path, os.getpid())
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'fetched_at': entry['fetched_at'], 'items': entry['items']}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            # The on-disk cache is an optimisation only.
+            pass
+
+    def _fetch(self, kind):
+        method_name, label = self.KINDS[kind]
+        try:
+            items = [
+                (item['id'], item['name'])
+                for item in iter_pages(getattr(self.api, method_name), self.page_size)
+            ]
+        except Exception as e:
+            raise Exception("Failed to fetch %ss from PrivX API: %s" % (label, e))
+        return self._build(time.time(), items)
+
+    def index(self, kind, refresh=False):
+        """Return the name/ID index for 'roles' or 'access_groups', fetching it if stale."""
+        with self._lock:
+            entry = self._indexes.get(kind)
+            if refresh or entry is None or self._expired(entry):
+                entry = None if refresh else self._load(kind)
+                if entry is None:
+                    entry = self._fetch(kind)
+                    self._save(kind, entry)
+                self._indexes[kind] = entry
+            return entry
+
+    def resolve(self, kind, refs):
+        """
+        Resolve a batch of references to IDs with a single directory lookup.
+
+        An index that is not fresh is re-fetched once before giving up on a
+        reference, so objects created within the TTL are still found.
+        """
+        if not refs:
+            return []
+        entry = self.index(kind)
+        ids = [_match(entry, ref) for ref in refs]
+        if None in ids and time.time() - entry['fetched_at'] > 1:
+            entry = self.index(kind, refresh=True)
+            ids = [_match(entry, ref) if ident is None else ident for ref, ident in zip(refs, ids)]
+        missing = [ref for ref, ident in zip(refs, ids) if ident is None]
+        if missing:
+            raise Exception("No matching {} found for input: {}".format(
+                self.KINDS[kind][1], missing[0] if len(missing) == 1 else missing))
+        return ids
+
+    def resolve_roles(self, refs):
+        return self.resolve('roles', refs)
+
+    def resolve_access_group(self, ref):
+        return self.resolve('access_groups', [ref])[0]
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import time
+
+from ansible_collections.garnser.privx.plugins.module_utils.diff import canonical
+
+DEFAULT_FINGERPRINT_DIR = '~/.ansible/tmp/privx_fingerprints'
+DEFAULT_FINGERPRINT_MAX_AGE = 86400
+FINGERPRINT_TAG_PREFIX = 'ansible-fingerprint:'
+
+
+def get_fingerprint_spec():
+    """Argument spec options controlling the fingerprint fast path."""
+    return {
+        'fingerprint': {'type': 'str', 'required': False, 'default': 'off', 'choices': ['off', 'state', 'tag']},
+        'fingerprint_dir': {'type': 'str', 'required': False},
+        'fingerprint_max_age': {'type': 'int', 'required': False, 'default': DEFAULT_FINGERPRINT_MAX_AGE},
+    }
+
+
+def host_fingerprint(host_data):
+    """Return a stable hash of a normalized host payload; unordered lists do not affect it."""
+    return hashlib.sha256(json.dumps(canonical(host_data), default=str).encode('utf-8')).hexdigest()
+
+
+def _parse_fingerprint_tag(host):
+    # Tags read ansible-fingerprint:<hash>:<verified at>; older tags carry no time
+    for tag in host.get('tags') or []:
+        if isinstance(tag, str) and tag.startswith(FINGERPRINT_TAG_PREFIX):
+            fingerprint, _, verified_at = tag[len(FINGERPRINT_TAG_PREFIX):].partition(':')
+            try:
+                return fingerprint, float(verified_at)
+            except ValueError:
+                return fingerprint, None
+    return None, None
+
+
+def fingerprint_tag(host):
+    """Return the fingerprint stored in a host's tags, or None."""
+    return _parse_fingerprint_tag(host)[0]
+
+
+def fingerprint_tag_matches(host, fingerprint, max_age=DEFAULT_FINGERPRINT_MAX_AGE):
+    """Whether a host's tag carries the fingerprint and was verified within max_age seconds."""
+    tagged, verified_at = _parse_fingerprint_tag(host)
+    if tagged != fingerprint or verified_at is None:
+        return False
+    max_age = DEFAULT_FINGERPRINT_MAX_AGE if max_age is None else max_age
+    return time.time() - verified_at <= max_age
+
+
+def with_fingerprint_tag(host_data, fingerprint, existing_host=None):
+    """Return a host payload whose tags carry the fingerprint and the current time, replacing any previous one."""
+    tags = host_data.get('tags')
+    if tags is None:
+        tags = (existing_host or {}).get('tags') or []
+    host_data = dict(host_data)
+    host_data['tags'] = [t for t in tags if not (isinstance(t, str) and t.startswith(FINGERPRINT_TAG_PREFIX))]
+    host_data['tags'].append('%s%s:%d' % (FINGERPRINT_TAG_PREFIX, fingerprint, time.time()))
+    return host_data
+
+
+class PrivXFingerprintStore(object):
+    """
+    Controller-side record of the last payload applied to each host.
+
+    One small file per host is kept under a directory per PrivX instance, so
+    concurrent forks never contend for a shared file.
+    """
+
+    def __init__(self, config, fingerprint_dir=None, max_age=DEFAULT_FINGERPRINT_MAX_AGE):
+        instance = '%s_%s' % (config.get('hostname', ''), config.get('hostport', ''))
+        self.directory = os.path.join(
+            os.path.expanduser(fingerprint_dir or DEFAULT_FINGERPRINT_DIR),
+            hashlib.sha256(instance.encode('utf-8')).hexdigest()[:16]
+        )
+        self.max_age = max_age
+
+    def _path(self, common_name):
+        return os.path.join(self.directory, hashlib.sha256(common_name.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, common_name, fingerprint):
+        """Return the recorded entry if it matches the fingerprint and was verified recently, else None."""
+        try:
+            with open(self._path(common_name), 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('fingerprint') != fingerprint:
+            return None
+        if time.time() - entry.get('verified_at', 0) > self.max_age:
+            return None
+        return entry
+
+    def put(self, common_name, fingerprint, host_id):
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            path = self._path(common_name)
+            tmp_path = '%s.%d.tmp' % (path, os.getpid())
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'fingerprint': fingerprint, 'id': host_id, 'verified_at': time.time()}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            # Without a record the next run simply takes the full path.
+            pass
+
+    def forget(self, common_name):
+        try:
+            os.unlink(self._path(common_name))
+        except OSError:
+            pass
+
+
+def get_fingerprint_store(params):
+    """Return the state-file store for module params, or None unless fingerprint is 'state'."""
+    if params.get('fingerprint') != 'state':
+        return None
+    return PrivXFingerprintStore(params['config'], params.get('fingerprint_dir'), params.get('fingerprint_max_age'))
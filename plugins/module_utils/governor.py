@@ -0,0 +1,286 @@
+import email.utils
+import functools
+import hashlib
+import http.client
+import json
+import random
+import threading
+import time
+
+from ansible_collections.garnser.privx.plugins.module_utils.token_cache import reauthenticate_privx_api
+
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 0.5
+DEFAULT_RETRY_BACKOFF_MAX = 30.0
+DEFAULT_BREAKER_THRESHOLD = 10
+DEFAULT_BREAKER_COOLDOWN = 30.0
+
+# Statuses meaning the request was turned away before being processed; safe to repeat for any call.
+THROTTLED_STATUSES = (429, 503)
+# Gateway errors; the request may have been processed, so only idempotent calls are repeated.
+GATEWAY_STATUSES = (502, 504)
+# Status of a request whose access token was rejected; it is repeated once with a new token.
+UNAUTHORIZED_STATUS = 401
+# SDK methods that can be repeated without side effects beyond the first call.
+IDEMPOTENT_PREFIXES = ('get_', 'search_', 'update_', 'delete_', 'resolve_', 'authenticate')
+
+# Per-thread state shared with the connection layer and the instrumentation.
+_THREAD = threading.local()
+
+# Governors shared by everything in this process talking to the same PrivX instance.
+_GOVERNORS = {}
+_GOVERNORS_LOCK = threading.Lock()
+
+
+class PrivXCircuitOpenError(Exception):
+    """Raised instead of calling PrivX while the circuit breaker is open."""
+
+
+def note_retry_after(value):
+    """Record the Retry-After header of the response just received on this thread."""
+    _THREAD.retry_after = value
+
+
+def retry_count():
+    """Return the number of retries made on this thread so far."""
+    return getattr(_THREAD, 'retries', 0)
+
+
+def note_retries(count=1):
+    """Add retries made on behalf of this thread, e.g. by the asyncio client."""
+    _THREAD.retries = retry_count() + count
+
+
+def parse_retry_after(value, now=None):
+    """Return the delay in seconds requested by a Retry-After header, or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+
+def _exception_status(exc):
+    # The SDK raises plain exceptions carrying the HTTP status, e.g. on authentication
+    for arg in getattr(exc, 'args', ()):
+        if isinstance(arg, int) and arg in THROTTLED_STATUSES + GATEWAY_STATUSES:
+            return arg
+    return None
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket limiting the request rate; a rate of None means unlimited."""
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.capacity = float(burst or max(1.0, rate or 1.0))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token if one is available and return 0, else return the seconds until one is."""
+        if not self.rate:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0
+            return (1.0 - self._tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+class CircuitBreaker(object):
+    """
+    Stops calls to PrivX after sustained failures.
+
+    The breaker opens after threshold consecutive failed attempts. While open,
+    calls fail immediately; after the cooldown a single trial call is let
+    through, and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, threshold=DEFAULT_BREAKER_THRESHOLD, cooldown=DEFAULT_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        if not self.threshold:
+            return
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining > 0 or self._trial:
+                raise PrivXCircuitOpenError(
+                    "PrivX API circuit breaker is open after %d consecutive failures; retrying in %.0fs."
+                    % (self.failures, max(remaining, 0))
+                )
+            self._trial = True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.threshold and (self._trial or self.failures >= self.threshold):
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+class PrivXRequestGovernor(object):
+    """Retry, backoff, circuit breaker and rate limit policy shared by the callers of one PrivX instance."""
+
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_RETRY_BACKOFF,
+                 backoff_max=DEFAULT_RETRY_BACKOFF_MAX, rate_limit=None, rate_burst=None,
+                 breaker_threshold=DEFAULT_BREAKER_THRESHOLD, breaker_cooldown=DEFAULT_BREAKER_COOLDOWN):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(rate_limit, rate_burst)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+
+    @classmethod
+    def from_config(cls, config):
+        def option(key, default):
+            value = config.get(key)
+            return default if value is None else value
+        return cls(
+            max_retries=option('max_retries', DEFAULT_MAX_RETRIES),
+            backoff=option('retry_backoff', DEFAULT_RETRY_BACKOFF),
+            backoff_max=option('retry_backoff_max', DEFAULT_RETRY_BACKOFF_MAX),
+            rate_limit=config.get('rate_limit'),
+            rate_burst=config.get('rate_burst'),
+            breaker_threshold=option('circuit_breaker_threshold', DEFAULT_BREAKER_THRESHOLD),
+            breaker_cooldown=option('circuit_breaker_cooldown', DEFAULT_BREAKER_COOLDOWN),
+        )
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait before the given retry: Retry-After if sent, else full-jitter exponential backoff."""
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt)))
+
+    def call(self, name, func, *args, **kwargs):
+        """Call an SDK method under this policy and return its response."""
+        idempotent = name.startswith(IDEMPOTENT_PREFIXES)
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            self.bucket.acquire()
+            _THREAD.retry_after = None
+            try:
+                response = func(*args, **kwargs)
+            except (OSError, http.client.HTTPException) as e:
+                status, error = None, e
+            except Exception as e:
+                status, error = _exception_status(e), e
+                if status is None:
+                    # Not a sign of an overloaded server; do not hold the breaker
+                    self.breaker.success()
+                    raise
+            else:
+                status, error = getattr(response, 'status', None), None
+                if status not in THROTTLED_STATUSES + GATEWAY_STATUSES:
+                    self.breaker.success()
+                    return response
+
+            self.breaker.failure()
+            retryable = status in THROTTLED_STATUSES or idempotent
+            if attempt >= self.max_retries or not retryable:
+                if error is not None:
+                    raise error
+                return response
+            time.sleep(self.delay(attempt, parse_retry_after(getattr(_THREAD, 'retry_after', None))))
+            attempt += 1
+            note_retries()
+
+
+class GovernedPrivXAPI(object):
+    """
+    Proxy around a privx_api.PrivXAPI object sending every public method call through a governor.
+
+    When a call is rejected with 401 and reauthenticate is given, it is
+    called with the proxy and the call is repeated once. Attribute reads and
+    writes other than method calls go straight to the wrapped object.
+    """
+
+    def __init__(self, api, governor, reauthenticate=None):
+        object.__setattr__(self, '_privx_wrapped', api)
+        object.__setattr__(self, '_privx_governor', governor)
+        object.__setattr__(self, '_privx_reauthenticate', reauthenticate)
+
+    def __getattr__(self, name):
+        attr = getattr(self._privx_wrapped, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        governor = self._privx_governor
+        reauthenticate = self._privx_reauthenticate
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            response = governor.call(name, attr, *args, **kwargs)
+            if (reauthenticate is not None and name != 'authenticate'
+                    and getattr(response, 'status', None) == UNAUTHORIZED_STATUS):
+                # The token was revoked or rejected, e.g. after a secret rotation or server restart
+                reauthenticate(self)
+                response = governor.call(name, attr, *args, **kwargs)
+            return response
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._privx_wrapped, name, value)
+
+    def __delattr__(self, name):
+        delattr(self._privx_wrapped, name)
+
+
+def get_governor(config):
+    """Return the governor shared by this process for the PrivX instance and settings in config."""
+    identity = [
+        config.get('hostname', ''),
+        str(config.get('hostport', '')),
+        config.get('max_retries'),
+        config.get('retry_backoff'),
+        config.get('retry_backoff_max'),
+        config.get('rate_limit'),
+        config.get('rate_burst'),
+        config.get('circuit_breaker_threshold'),
+        config.get('circuit_breaker_cooldown'),
+    ]
+    key = hashlib.sha256(json.dumps(identity).encode('utf-8')).hexdigest()
+    with _GOVERNORS_LOCK:
+        governor = _GOVERNORS.get(key)
+        if governor is None:
+            governor = _GOVERNORS[key] = PrivXRequestGovernor.from_config(config)
+        return governor
+
+
+def govern(api, config):
+    """Return api wrapped in a GovernedPrivXAPI using the shared governor for config, re-authenticating on 401."""
+    if isinstance(api, GovernedPrivXAPI):
+        return api
+    return GovernedPrivXAPI(api, get_governor(config), functools.partial(reauthenticate_privx_api, config=config))
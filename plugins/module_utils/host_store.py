@@ -1,10 +1,557 @@
-from ansible_collections.garnser.privx.plugins.module_utils.role_store import PrivXRoleStore
-from ansible_collections.garnser.privx.plugins.module_utils.authorizer import PrivXAuthorizer
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from ansible_collections.garnser.privx.plugins.module_utils.privx_utils import iter_pages, DEFAULT_PAGE_SIZE
+from ansible_collections.garnser.privx.plugins.module_utils.diff import diff_values, merge_keyed, HOST_LIST_KEYS
+from ansible_collections.garnser.privx.plugins.module_utils.directory import PrivXDirectory
+from ansible_collections.garnser.privx.plugins.module_utils.records import compact_host, HOST_KEY_FIELDS
+from ansible_collections.garnser.privx.plugins.module_utils.fingerprint import (
+    get_fingerprint_spec, get_fingerprint_store, host_fingerprint, fingerprint_tag_matches, with_fingerprint_tag
+)
+
+DEFAULT_CONCURRENCY = 8
+# Most hosts a prune deletes unless told otherwise.
+DEFAULT_MAX_DELETIONS = 100
+PRUNE_KEYS = ['common_name', 'external_id']
+# Host searches match common names partially; small pages let an exact match end the search early.
+DEFAULT_SEARCH_PAGE_SIZE = 100
+
+# How add_host fills in host_details after a change: not at all, from the
+# data sent and received, or by fetching the host again.
+RETURN_DETAILS_CHOICES = ['none', 'merged', 'fetch']
+DEFAULT_RETURN_DETAILS = 'fetch'
+
+# Fields identifying a principal on a host.
+PRINCIPAL_KEY = HOST_LIST_KEYS['principals']
+
+
+def role_ids(principal):
+    """Return the set of role IDs granted by a principal; PrivX adds role names the payload leaves out."""
+    return {role.get('id') for role in principal.get('roles') or []}
+
+
+def normalize_host_data(host_data):
+    """Return host data without the options Ansible left unset."""
+    return _strip_unset(host_data)
+
+
+def get_host_data_options():
+    """Argument spec options describing a single PrivX host."""
+    return {
+        'common_name': {'type': 'str', 'required': True},
+        'addresses': {'type': 'list', 'elements': 'str', 'required': False},
+        'tofu': {'type': 'bool', 'required': False},
+        'access_group': {'type': 'str', 'required': False},
+        'external_id': {'type': 'str', 'required': False},
+        'ssh_host_public_keys': {'type': 'list', 'required': False},
+        'services': {
+            'type': 'list',
+            'elements': 'dict',
+            'options': {
+                'service': {'type': 'str', 'required': True},
+                'address': {'type': 'str', 'required': True},
+                'port': {'type': 'int', 'required': True},
+                'source': {'type': 'str', 'required': False}
+            }
+        },
+        'principals': {
+            'type': 'list',
+            'elements': 'dict',
+            'options': {
+                'principal': {'type': 'str', 'required': True},
+                'passphrase': {'type': 'str', 'required': False},
+                'use_user_account': {'type': 'bool', 'required': True},
+                'source': {'type': 'str', 'required': False},
+                'roles': {
+                    'type': 'list',
+                    'elements': 'dict',
+                    'options': {
+                        'name': {'type': 'str', 'required': True}
+                    }
+                }
+            }
+        }
+    }
+
+
+def get_add_host_spec():
+    """Argument spec of add_host, shared by the module and its action plugin."""
+    spec = {
+        'host_data': {
+            'type': 'dict',
+            'required': True,
+            'options': get_host_data_options()
+        },
+        'search_page_size': {'type': 'int', 'required': False, 'default': DEFAULT_SEARCH_PAGE_SIZE},
+        'return_details': {
+            'type': 'str',
+            'required': False,
+            'default': DEFAULT_RETURN_DETAILS,
+            'choices': RETURN_DETAILS_CHOICES
+        },
+    }
+    spec.update(get_fingerprint_spec())
+    return spec
+
+
+def _strip_unset(value):
+    """Drop options Ansible filled in as None, so unset fields leave existing data alone."""
+    if isinstance(value, dict):
+        return {k: _strip_unset(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [_strip_unset(v) for v in value]
+    return value
+
+
+class PrivXPruneLimitError(Exception):
+    """Raised when a prune would delete more hosts than allowed; carries the stale hosts."""
+
+    def __init__(self, msg, results):
+        super(PrivXPruneLimitError, self).__init__(msg)
+        self.results = results
+
 
 class PrivXHostStore(object):
+    """Host operations on top of the PrivX host-store API."""
 
-    def __init__(self, api):
+    def __init__(self, api, directory=None, page_size=DEFAULT_PAGE_SIZE, snapshot=None):
         self.api = api
+        self.directory = directory or PrivXDirectory.get(api)
+        self.page_size = page_size
+        self.snapshot = snapshot
+        self._records = None
+
+    def prepare(self, host_data):
+        """Return a host payload with unset options removed and roles and access group resolved to IDs."""
+        host_data = normalize_host_data(host_data)
+
+        principals = [p for p in host_data.get('principals', []) if 'roles' in p]
+        role_ids = iter(self.directory.resolve_roles(
+            [role for principal in principals for role in principal['roles']]
+        ))
+        for principal in principals:
+            principal['roles'] = [{'id': next(role_ids)} for role in principal['roles']]
+
+        if 'access_group' in host_data:
+            host_data['access_group_id'] = self.directory.resolve_access_group(host_data.pop('access_group'))
+
+        return host_data
+
+    @staticmethod
+    def merge(existing_host_data, new_host_data):
+        """
+        Return the existing host updated with new data.
+
+        Principals are merged by identity rather than replaced, and fields that
+        only differ in the order of an unordered list keep their existing value,
+        so equivalent data never produces an update.
+        """
+        updated_host_data = dict(existing_host_data)
+
+        for key, value in new_host_data.items():
+            existing = existing_host_data.get(key)
+            if key == 'principals':
+                # Replace a principal only if it grants different roles
+                updated_host_data[key] = merge_keyed(
+                    existing or [], value, PRINCIPAL_KEY,
+                    lambda old, new: role_ids(old) != role_ids(new)
+                )
+            elif key == 'ssh_host_public_keys':
+                if not existing:
+                    updated_host_data[key] = value
+            elif diff_values(existing, value, key) is not None:
+                updated_host_data[key] = value
+
+        return updated_host_data
+
+    @staticmethod
+    def diff(existing_host_data, updated_host_data):
+        """Return the minimal nested diff between two hosts, or None if they are equivalent."""
+        return diff_values(existing_host_data, updated_host_data)
+
+    def list_hosts(self):
+        """Yield every host known to PrivX, one page at a time."""
+        return iter_pages(self.api.get_hosts, self.page_size)
+
+    def search_hosts(self, search_payload, page_size=None):
+        """Yield the hosts matching a search payload, requesting further pages only as they are consumed."""
+        return iter_pages(self.api.search_hosts, page_size or self.page_size, search_payload=search_payload)
+
+    def find_host(self, common_name):
+        """Return the host whose common name matches exactly, or None; stops paging at the first match."""
+        for host in self.search_hosts({'common_name': [common_name]}):
+            if host.get('common_name') == common_name:
+                return host
+        return None
+
+    def index_hosts(self, common_names=None, keep_others=True):
+        """
+        Return existing hosts keyed by common name.
+
+        With common_names, only those hosts are indexed, so memory use does not
+        grow with the full data of every host in PrivX. With keep_others, every
+        listed host, including hosts sharing a common name, is also kept as a
+        compact record for stale_hosts(). With a snapshot, only hosts changed
+        since its last refresh are downloaded.
+        """
+        self._records = None
+        if self.snapshot is not None:
+            self.snapshot.refresh(self.api, page_size=self.page_size)
+            if common_names is None:
+                return self.snapshot.hosts_by_common_name()
+            # stale_hosts() streams the snapshot instead of keeping records
+            index = {}
+            for common_name in common_names:
+                host = self.snapshot.find_host(common_name)
+                if host is not None:
+                    index[common_name] = host
+            return index
+        index = {}
+        records = [] if keep_others else None
+        for host in self.list_hosts():
+            if records is not None:
+                records.append(compact_host(host))
+            common_name = host.get('common_name')
+            if common_name in index:
+                continue
+            if common_names is None or common_name in common_names:
+                index[common_name] = host
+        self._records = records
+        return index
+
+    def _apply(self, item):
+        if item['action'] == 'create':
+            response = self.api.create_host(item['payload'])
+            if not response.ok:
+                raise Exception("Host creation failed: {}".format(response.data))
+            return (response.data or {}).get('id')
+        response = self.api.update_host(item['id'], item['payload'])
+        if not response.ok:
+            raise Exception("Host update failed: {}".format(response.data))
+        return item['id']
+
+    def reconcile(self, hosts, concurrency=DEFAULT_CONCURRENCY, check_mode=False,
+                  fingerprint_mode='off', fingerprints=None, keep_index=False, fingerprint_max_age=None):
+        """
+        Create or update a list of hosts.
+
+        Existing hosts are fetched once and compared locally; only the resulting
+        create and update calls are sent, through a pool of `concurrency` threads.
+        With fingerprint_mode 'state', hosts whose payload matches a recently
+        verified record in `fingerprints` are skipped, and existing hosts are not
+        fetched at all if every host is skipped. With 'tag', a host whose
+        fingerprint tag matches, and was written within fingerprint_max_age
+        seconds, is not compared.
+        With keep_index, every existing host is also remembered as a compact
+        record for a following stale_hosts().
+        Returns per-host results in input order and a count per action.
+        """
+        results = [{'common_name': host.get('common_name'), 'changed': False} for host in hosts]
+        seen = set()
+        candidates = []
+
+        for host, result in zip(hosts, results):
+            common_name = result['common_name']
+            if common_name in seen:
+                result.update(action='failed', msg="Duplicate common_name in input.")
+                continue
+            seen.add(common_name)
+
+            fingerprint = host_fingerprint(normalize_host_data(host))
+            entry = fingerprints.get(common_name, fingerprint) if fingerprints else None
+            if entry:
+                result.update(action='unchanged', id=entry['id'], msg="No update necessary; fingerprint unchanged.")
+                continue
+            candidates.append((host, result, fingerprint))
+
+        existing = {}
+        if candidates:
+            existing = self.index_hosts(
+                {result['common_name'] for host, result, fingerprint in candidates}, keep_others=keep_index
+            )
+        pending = []
+        verified = []
+
+        for host, result, fingerprint in candidates:
+            common_name = result['common_name']
+            try:
+                payload = self.prepare(host)
+            except Exception as e:
+                result.update(action='failed', msg=str(e))
+                continue
+
+            current = existing.get(common_name)
+            if current is None:
+                if fingerprint_mode == 'tag':
+                    payload = with_fingerprint_tag(payload, fingerprint)
+                item = {'action': 'create', 'payload': payload}
+                result.update(action='created', msg="Host created.")
+            else:
+                result['id'] = current.get('id')
+                if fingerprint_mode == 'tag':
+                    if fingerprint_tag_matches(current, fingerprint, fingerprint_max_age):
+                        result.update(action='unchanged', msg="No update necessary; fingerprint unchanged.")
+                        continue
+                    payload = with_fingerprint_tag(payload, fingerprint, current)
+                updated = self.merge(current, payload)
+                diff = self.diff(current, updated)
+                if diff is None:
+                    result.update(action='unchanged', msg="No update necessary; no data has changed.")
+                    verified.append((result, fingerprint))
+                    continue
+                item = {'action': 'update', 'id': current.get('id'), 'payload': updated}
+                result.update(action='updated', msg="Host updated.", diff=diff)
+            result['changed'] = True
+            if not check_mode:
+                pending.append((item, result))
+                verified.append((result, fingerprint))
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+                futures = [(executor.submit(self._apply, item), result) for item, result in pending]
+                for future, result in futures:
+                    try:
+                        result['id'] = future.result()
+                    except Exception as e:
+                        result.update(action='failed', changed=False, msg=str(e))
+
+        if fingerprints and not check_mode:
+            for result, fingerprint in verified:
+                if result['action'] != 'failed' and result.get('id'):
+                    fingerprints.put(result['common_name'], fingerprint, result['id'])
+
+        summary = {'created': 0, 'updated': 0, 'unchanged': 0, 'failed': 0}
+        for result in results:
+            summary[result['action']] += 1
+        return results, summary
+
+    def stale_hosts(self, desired, key='common_name'):
+        """
+        Return the hosts whose key is not in the desired set, streaming the host list once.
+
+        Hosts without a value for key are never considered stale. The records
+        kept by index_hosts() are reused instead of listing hosts again. Stale
+        hosts are returned as compact records of their ID, common name and
+        external ID.
+        """
+        desired = set(desired)
+        if self._records is not None and key in HOST_KEY_FIELDS:
+            hosts = self._records
+        elif self.snapshot is not None:
+            self.snapshot.refresh(self.api, page_size=self.page_size)
+            hosts = self.snapshot.iter_hosts()
+        else:
+            hosts = self.list_hosts()
+        return [compact_host(host) for host in hosts if host.get(key) and host.get(key) not in desired]
+
+    def _delete(self, host_id):
+        response = self.api.delete_host(host_id)
+        if not response.ok:
+            raise Exception("Host deletion failed: {}".format(response.data))
+
+    def prune(self, desired, key='common_name', max_deletions=DEFAULT_MAX_DELETIONS,
+              concurrency=DEFAULT_CONCURRENCY, check_mode=False, fingerprints=None):
+        """
+        Delete every host whose key is not in the desired set.
+
+        Nothing is deleted if more than max_deletions hosts would be; the
+        stale hosts are still returned, so the result doubles as a dry run.
+        In check mode, stale hosts get the action 'would_delete' instead.
+        Deletions are sent through a pool of `concurrency` threads.
+        Returns per-host results and a count per action, or raises if the cap
+        would be exceeded.
+        """
+        if not desired:
+            raise Exception("Refusing to prune with an empty set of desired hosts.")
+        stale = self.stale_hosts(desired, key)
+        results = [
+            {'common_name': host.get('common_name'), 'external_id': host.get('external_id'),
+             'id': host.get('id'), 'action': 'deleted', 'changed': True, 'msg': "Host deleted."}
+            for host in stale
+        ]
+        if check_mode:
+            for result in results:
+                result.update(action='would_delete', msg="Host would be deleted.")
+        if max_deletions is not None and len(stale) > max_deletions:
+            for result in results:
+                result.update(action='stale', changed=False, msg="Not deleted; max_deletions exceeded.")
+            raise PrivXPruneLimitError(
+                "Refusing to delete {} hosts; max_deletions is {}.".format(len(stale), max_deletions), results
+            )
+
+        if results and not check_mode:
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+                futures = [(executor.submit(self._delete, result['id']), result) for result in results]
+                for future, result in futures:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        result.update(action='failed', changed=False, msg=str(e))
+                        continue
+                    if fingerprints and result['common_name']:
+                        fingerprints.forget(result['common_name'])
+
+        summary = {'deleted': 0, 'would_delete': 0, 'failed': 0}
+        for result in results:
+            summary[result['action']] += 1
+        return results, summary
+
+
+def _merge_and_update(api, host_id, existing_host_data, new_host_data, result, check_mode=False):
+    # Copy current host data, but update with new data where applicable
+    updated_host_data = PrivXHostStore.merge(existing_host_data, new_host_data)
+
+    # Check if any relevant data has changed before making an update call
+    diff = PrivXHostStore.diff(existing_host_data, updated_host_data)
+    if diff is None:
+        return "No update necessary; no data has changed.", False, existing_host_data
+    if check_mode:
+        result['diff'] = diff
+        return "Host would be updated.", True, updated_host_data
+
+    update_response = api.update_host(host_id, updated_host_data)
+    if not update_response._ok:
+        raise Exception(f"Host update failed: {update_response._data}")
+    result['diff'] = diff
+    return "Host updated successfully.", True, updated_host_data
+
+
+def _host_details(api, host_id, local_details, mode):
+    """
+    Return (details, error) for a changed host according to the return_details mode.
+
+    'merged' builds the details from the data sent and the write response,
+    'fetch' asks PrivX for its view of the host.
+    """
+    if mode == 'none':
+        return None, None
+    if mode == 'merged':
+        return dict(local_details, id=host_id), None
+    try:
+        response = api.get_host(host_id)
+    except Exception as e:
+        return None, f"{e}"
+    if response.status == HTTPStatus.OK:
+        return response._data, None
+    return None, response._data
+
+
+def add_host(api, params, host_data, result, check_mode=False):
+    """
+    Create or update a single host from add_host parameters, filling in result.
+
+    This is the add_host logic shared by the module and the controller-side
+    action plugin.
+    """
+    hoststore = PrivXHostStore(
+        api,
+        PrivXDirectory.get(api, params['config']),
+        page_size=params['search_page_size']
+    )
+
+    fingerprint_mode = params['fingerprint']
+    fingerprints = get_fingerprint_store(params)
+    return_details = params.get('return_details') or DEFAULT_RETURN_DETAILS
+    common_name = host_data['common_name']
+    fingerprint = host_fingerprint(normalize_host_data(host_data))
+
+    # Skip the search and compare if this payload was applied and verified recently
+    if fingerprints:
+        entry = fingerprints.get(common_name, fingerprint)
+        if entry:
+            result['msg'] = "No update necessary; fingerprint unchanged."
+            result['host_id'] = entry['id']
+            return result
+
+    # Resolve roles and access group to IDs
+    try:
+        host_data = hoststore.prepare(host_data)
+    except Exception as e:
+        result['failed'] = True
+        result['msg'] = f"{e}"
+        return result
+
+    # Search for the host by common name, stopping at the first exact match
+    try:
+        existing_host = hoststore.find_host(host_data['common_name'])
+    except Exception as e:
+        result['failed'] = True
+        result['msg'] = f"Host search failed: {e}"
+        return result
+
+    if existing_host is not None:
+        host_id = existing_host["id"]
+        if fingerprint_mode == 'tag':
+            if fingerprint_tag_matches(existing_host, fingerprint, params.get('fingerprint_max_age')):
+                result['msg'] = "No update necessary; fingerprint unchanged."
+                result['host_id'] = host_id
+                return result
+            host_data = with_fingerprint_tag(host_data, fingerprint, existing_host)
+
+        # Host exists, possibly update the host
+        try:
+            msg, changed, updated_host = _merge_and_update(
+                api, host_id, existing_host, host_data, result, check_mode=check_mode
+            )
+        except Exception as e:
+            result['failed'] = True
+            result['msg'] = f"{e}"
+            return result
+
+        result['msg'] = msg
+        if changed:
+            result['changed'] = True
+        if changed and not check_mode:
+            details, error = _host_details(api, host_id, updated_host, return_details)
+            if details is not None:
+                result['host_details'] = details
+            if return_details == 'fetch':
+                if error is None:
+                    result['msg'] += " Updated successfully and details retrieved."
+                else:
+                    result['msg'] += f" Failed to retrieve updated host details: {error}"
+
+    else:
+        # Host does not exist, create the host
+        if fingerprint_mode == 'tag':
+            host_data = with_fingerprint_tag(host_data, fingerprint)
+        if check_mode:
+            result['changed'] = True
+            result['msg'] = "Host would be created."
+            return result
+        try:
+            create_response = api.create_host(host_data)
+        except Exception as e:
+            result['failed'] = True
+            result['msg'] = f"Host creation failed: {e}"
+            return result
+        if create_response._ok:
+            if 'id' in create_response._data:
+                host_id = create_response._data['id']
+                result['changed'] = True
+                details, error = _host_details(
+                    api, host_id, dict(host_data, **create_response._data), return_details
+                )
+                if details is not None:
+                    result['host_details'] = details
+                if error is not None:
+                    result['failed'] = True
+                    result['msg'] = f"Failed to retrieve host details: {error}"
+                elif return_details == 'fetch':
+                    result['msg'] = "Host created successfully and details retrieved."
+                else:
+                    result['msg'] = "Host created successfully."
+            else:
+                result['failed'] = True
+                result['msg'] = "Host created but no ID returned in response."
+        else:
+            result['failed'] = True
+            result['msg'] = f"Host creation failed: {create_response._data.get('error', 'Unknown error')}"
+
+    if result['failed']:
+        return result
 
-    def add_host():
-        return True
+    result['host_id'] = host_id
+    if fingerprints and not check_mode:
+        fingerprints.put(common_name, fingerprint, host_id)
+    return result
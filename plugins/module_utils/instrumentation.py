@@ -0,0 +1,183 @@
+import functools
+import json
+import threading
+import time
+
+from ansible_collections.garnser.privx.plugins.module_utils.client import received_bytes, tls_handshakes
+from ansible_collections.garnser.privx.plugins.module_utils.governor import retry_count
+
+# Upper bounds of the latency histogram buckets, in milliseconds.
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Whether an instrumented call is in progress on each thread.
+_CURRENT = threading.local()
+
+
+def _bucket_label(seconds):
+    ms = seconds * 1000.0
+    for bound in LATENCY_BUCKETS_MS:
+        if ms <= bound:
+            return str(bound)
+    return 'inf'
+
+
+def empty_histogram():
+    histogram = {str(bound): 0 for bound in LATENCY_BUCKETS_MS}
+    histogram['inf'] = 0
+    return histogram
+
+
+def _response_size(response):
+    """Estimate the size of a response body from its decoded data."""
+    data = getattr(response, 'data', None)
+    if not data:
+        return 0
+    try:
+        return len(json.dumps(data))
+    except (TypeError, ValueError):
+        return 0
+
+
+class PrivXAPIStats(object):
+    """Thread-safe per-endpoint call counts, latency histograms, retries, response bytes and TLS handshakes."""
+
+    def __init__(self):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, ok=True, retries=0, size=0, handshakes=0, resumed=0):
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = {
+                    'calls': 0,
+                    'errors': 0,
+                    'retries': 0,
+                    'bytes': 0,
+                    'handshakes': 0,
+                    'resumed': 0,
+                    'total_seconds': 0.0,
+                    'max_seconds': 0.0,
+                    'histogram': empty_histogram(),
+                }
+            stats['calls'] += 1
+            stats['errors'] += 0 if ok else 1
+            stats['retries'] += retries
+            stats['bytes'] += size
+            stats['handshakes'] += handshakes
+            stats['resumed'] += resumed
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['histogram'][_bucket_label(seconds)] += 1
+
+    def to_dict(self):
+        """Return the stats in the form returned by modules as C(api_stats)."""
+        with self._lock:
+            endpoints = {}
+            for name, stats in self.endpoints.items():
+                # Empty buckets are left out to keep results small
+                histogram = {label: count for label, count in stats['histogram'].items() if count}
+                endpoints[name] = dict(stats, histogram=histogram)
+                endpoints[name]['total_seconds'] = round(stats['total_seconds'], 6)
+                endpoints[name]['max_seconds'] = round(stats['max_seconds'], 6)
+        return {
+            'calls': sum(s['calls'] for s in endpoints.values()),
+            'errors': sum(s['errors'] for s in endpoints.values()),
+            'retries': sum(s['retries'] for s in endpoints.values()),
+            'bytes': sum(s['bytes'] for s in endpoints.values()),
+            'handshakes': sum(s['handshakes'] for s in endpoints.values()),
+            'resumed': sum(s['resumed'] for s in endpoints.values()),
+            'total_seconds': round(sum(s['total_seconds'] for s in endpoints.values()), 6),
+            'endpoints': endpoints,
+        }
+
+    def summary(self):
+        """Return a one-line summary, slowest endpoints first."""
+        endpoints = sorted(self.to_dict()['endpoints'].items(), key=lambda item: -item[1]['total_seconds'])
+        return ', '.join(
+            '%s: %d calls in %.3fs' % (name, stats['calls'], stats['total_seconds']) for name, stats in endpoints
+        )
+
+
+class InstrumentedPrivXAPI(object):
+    """
+    Proxy around a privx_api.PrivXAPI object recording every public method call.
+
+    Attribute reads and writes other than method calls go straight to the
+    wrapped object, so the proxy can be used wherever the API object is.
+    """
+
+    def __init__(self, api, stats=None):
+        object.__setattr__(self, '_privx_wrapped', api)
+        object.__setattr__(self, '_privx_stats', stats if stats is not None else PrivXAPIStats())
+
+    @property
+    def api_stats(self):
+        return self._privx_stats
+
+    def __getattr__(self, name):
+        attr = getattr(self._privx_wrapped, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        stats = self._privx_stats
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            if getattr(_CURRENT, 'active', False):
+                # Nested call through another proxy; the outer one records it.
+                return attr(*args, **kwargs)
+            _CURRENT.active = True
+            before = received_bytes()
+            retries_before = retry_count()
+            handshakes_before, resumed_before = tls_handshakes()
+            start = time.perf_counter()
+            ok = False
+            response = None
+            try:
+                response = attr(*args, **kwargs)
+                ok = getattr(response, 'ok', True)
+                return response
+            finally:
+                elapsed = time.perf_counter() - start
+                _CURRENT.active = False
+                size = received_bytes() - before
+                if not size and response is not None:
+                    # Bytes are only counted on the wire for pooled connections.
+                    size = _response_size(response)
+                handshakes, resumed = tls_handshakes()
+                stats.record(name, elapsed, ok=bool(ok), retries=retry_count() - retries_before, size=size,
+                             handshakes=handshakes - handshakes_before, resumed=resumed - resumed_before)
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._privx_wrapped, name, value)
+
+    def __delattr__(self, name):
+        delattr(self._privx_wrapped, name)
+
+
+def instrument(api, enabled=True):
+    """Return api wrapped in an InstrumentedPrivXAPI if enabled, else api unchanged."""
+    if not enabled or isinstance(api, InstrumentedPrivXAPI):
+        return api
+    return InstrumentedPrivXAPI(api)
+
+
+def record_responses(api, endpoint, responses):
+    """Record responses fetched outside the proxy, e.g. concurrently by the asyncio client."""
+    if not isinstance(api, InstrumentedPrivXAPI):
+        return
+    for response in responses:
+        api.api_stats.record(
+            endpoint, getattr(response, 'seconds', 0.0), ok=bool(getattr(response, 'ok', True)),
+            retries=getattr(response, 'retries', 0), size=getattr(response, 'size', 0) or _response_size(response),
+            handshakes=getattr(response, 'handshakes', 0), resumed=getattr(response, 'resumed', 0),
+        )
+
+
+def get_api_stats(api):
+    """Return the recorded stats of an instrumented API object as a dict, or None."""
+    if isinstance(api, InstrumentedPrivXAPI):
+        return api.api_stats.to_dict()
+    return None
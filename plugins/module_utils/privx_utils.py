@@ -1,12 +1,21 @@
 import traceback
-import os
 import json
+import inspect
 
 from ansible.module_utils.common.text.converters import to_text
 from ansible.module_utils._text import to_native
 from ansible.module_utils.common.collections import is_iterable
 from ansible.module_utils.basic import AnsibleModule, missing_required_lib, _load_params
 from ansible.module_utils.urls import open_url
+from ansible_collections.garnser.privx.plugins.module_utils.token_cache import authenticate_privx_api
+from ansible_collections.garnser.privx.plugins.module_utils.diff import diff_values
+from ansible_collections.garnser.privx.plugins.module_utils.instrumentation import instrument, get_api_stats
+from ansible_collections.garnser.privx.plugins.module_utils.governor import govern
+from ansible_collections.garnser.privx.plugins.module_utils.client import (
+    enable_connection_pool,
+    get_certificate_content,
+    DEFAULT_POOL_SIZE,
+)
 
 HAS_PRIVX = True
 
@@ -16,6 +25,8 @@ except ImportError:
     PRIVX_IMP_ERR = traceback.format_exc()
     HAS_PRIVX = False
 
+DEFAULT_PAGE_SIZE = 1000
+
 def _get_common_config_spec():
     return {
         'hostname': {'type': 'str', 'required': True},
@@ -25,6 +36,23 @@ def _get_common_config_spec():
         'oauth_client_secret': {'type': 'str', 'required': True},
         'api_client_id': {'type': 'str', 'required': True},
         'api_client_secret': {'type': 'str', 'required': True},
+        'token_cache': {'type': 'bool', 'required': False, 'default': True},
+        'token_cache_dir': {'type': 'str', 'required': False},
+        'directory_cache_ttl': {'type': 'int', 'required': False, 'default': 300},
+        'directory_cache_dir': {'type': 'str', 'required': False},
+        'api_stats': {'type': 'bool', 'required': False, 'default': False},
+        'snapshot': {'type': 'bool', 'required': False, 'default': False},
+        'snapshot_path': {'type': 'str', 'required': False},
+        'snapshot_max_age': {'type': 'int', 'required': False, 'default': 300},
+        'connection_pool': {'type': 'bool', 'required': False, 'default': True},
+        'pool_size': {'type': 'int', 'required': False, 'default': DEFAULT_POOL_SIZE},
+        'max_retries': {'type': 'int', 'required': False, 'default': 3},
+        'retry_backoff': {'type': 'float', 'required': False, 'default': 0.5},
+        'retry_backoff_max': {'type': 'float', 'required': False, 'default': 30.0},
+        'rate_limit': {'type': 'float', 'required': False},
+        'rate_burst': {'type': 'int', 'required': False},
+        'circuit_breaker_threshold': {'type': 'int', 'required': False, 'default': 10},
+        'circuit_breaker_cooldown': {'type': 'float', 'required': False, 'default': 30.0},
     }
 
 def define_argument_spec(module_specific_argument_spec):
@@ -42,22 +70,43 @@ def define_argument_spec(module_specific_argument_spec):
 
 def diff_dicts(dict1, dict2):
     """
-    Compare two dictionaries and return their differences.
+    Compare two dictionaries and return their differences, recursing into
+    nested values. Unordered PrivX list fields are compared as sets.
+    """
+    return diff_values(dict1, dict2) or {}
+
+def iter_pages(method, page_size=DEFAULT_PAGE_SIZE, **kwargs):
+    """
+    Yield the items of a PrivX listing, requesting one page at a time.
+
+    SDK methods that do not accept offset/limit are called once.
     """
-    diff = {}
-    # Check keys present in dict1 but not in dict2
-    for key in dict1.keys():
-        if key not in dict2:
-            diff[key] = {'old': dict1[key], 'new': None}
-    # Check keys present in dict2 but not in dict1
-    for key in dict2.keys():
-        if key not in dict1:
-            diff[key] = {'old': None, 'new': dict2[key]}
-    # Check keys present in both dicts
-    for key in dict1.keys() & dict2.keys():
-        if dict1[key] != dict2[key]:
-            diff[key] = {'old': dict1[key], 'new': dict2[key]}
-    return diff
+    try:
+        paged = 'offset' in inspect.signature(method).parameters
+    except (TypeError, ValueError):
+        paged = False
+
+    offset = 0
+    while True:
+        if paged:
+            response = method(offset=offset, limit=page_size, **kwargs)
+        else:
+            response = method(**kwargs)
+        if not response.ok:
+            raise Exception("PrivX API request failed with status {}: {}".format(response.status, response.data))
+        data = response.data or {}
+        items = data.get('items') or []
+        for item in items:
+            yield item
+        offset += len(items)
+        if not paged or not items:
+            return
+        # The server may return shorter pages than asked for; trust the total when it is given
+        if 'count' in data:
+            if offset >= data['count']:
+                return
+        elif len(items) < page_size:
+            return
 
 class PrivXAnsibleModule(object):
     def __init__(self, module_params):
@@ -66,7 +115,7 @@ class PrivXAnsibleModule(object):
             argument_spec=define_argument_spec(module_params),
             supports_check_mode=True
         )
-        self.config = module_params.get('config', {})
+        self.config = self.module.params['config']
 
         # Check if the privx_api library is available
         if not HAS_PRIVX:
@@ -83,15 +132,26 @@ class PrivXAnsibleModule(object):
     def api(self):
         return self.privx
 
+    def add_api_stats(self, result):
+        """Add the recorded per-endpoint API stats to a module result when config.api_stats is set."""
+        stats = get_api_stats(self.privx)
+        if stats is not None:
+            result['api_stats'] = stats
+        return result
+
     def _initialize_privx_api(self):
+        # Pooled connections are kept alive between calls and expose Retry-After to the governor
+        if self.config.get('connection_pool', True):
+            enable_connection_pool(self.config.get('pool_size') or DEFAULT_POOL_SIZE)
         try:
-            self.privx = privx_api.PrivXAPI(
+            # Wrapped before authenticating, so the token request is governed and recorded too
+            self.privx = instrument(govern(privx_api.PrivXAPI(
                 self.config.get('hostname', ''),
                 self.config.get('hostport', ''),
                 self._get_certificate_content(self.config.get('ca_cert', '')),
                 self.config.get('oauth_client_id', ''),
                 self.config.get('oauth_client_secret', ''),
-            )
+            ), self.config), self.config.get('api_stats', False))
         except Exception as e:
             self.module.fail_json(
                 msg=f"Failed to establish connection to PrivX API: {e}"
@@ -99,18 +159,11 @@ class PrivXAnsibleModule(object):
 
     def _authenticate_privx_api(self):
         try:
-            self.privx.authenticate(
-                self.config.get('api_client_id', ''),
-                self.config.get('api_client_secret', '')
-            )
+            authenticate_privx_api(self.privx, self.config)
         except Exception as e:
             self.module.fail_json(
-                msg=f"Failed to authenticate to the PrivX API: {e} {api_client_id} {api_client_secret}"
+                msg=f"Failed to authenticate to the PrivX API: {e}"
             )
 
     def _get_certificate_content(self, ca_cert):
-        if os.path.isfile(ca_cert):
-            with open(ca_cert, 'r') as file:
-                return file.read()
-        else:
-            return ca_cert
+        return get_certificate_content(ca_cert)
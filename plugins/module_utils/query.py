@@ -0,0 +1,173 @@
+from ansible_collections.garnser.privx.plugins.module_utils.privx_utils import iter_pages, DEFAULT_PAGE_SIZE
+
+# Fields returned by default for each kind of object; 'all' returns whole objects.
+DEFAULT_FIELDS = {
+    'roles': ['id', 'name'],
+    'access_groups': ['id', 'name'],
+    'hosts': ['id', 'common_name', 'external_id', 'addresses', 'access_group_id'],
+}
+# Host fields the host-store search can filter on.
+HOST_SEARCH_KEYS = ('common_name', 'external_id', 'addresses')
+LISTING_METHODS = {
+    'roles': 'get_roles',
+    'access_groups': 'get_access_groups',
+}
+
+
+def project(item, fields):
+    """Return item reduced to the given fields; fields 'all' or None keeps everything."""
+    if fields is None or fields == 'all':
+        return item
+    return {field: item[field] for field in fields if field in item}
+
+
+def iter_projected(items, fields):
+    """Yield each item projected to fields, holding one whole item at a time."""
+    for item in items:
+        yield project(item, fields)
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+class PrivXQuery(object):
+    """
+    Resolves lists of role, access group and host names or IDs with as few requests as possible.
+
+    Roles and access groups are matched against one scan of the collection,
+    or the snapshot; hosts are looked up with one batched, paged host-store
+    search, and only hosts given by ID are fetched one by one.
+    """
+
+    def __init__(self, api, snapshot=None, page_size=DEFAULT_PAGE_SIZE, listing=None, get_hosts=None):
+        self.api = api
+        self.snapshot = snapshot
+        self.page_size = page_size
+        # Optional callables replacing the collection scan and the per-ID host reads
+        self._listing = listing
+        self._get_hosts = get_hosts
+
+    def listing(self, kind):
+        """Return every role or access group."""
+        if self.snapshot is not None:
+            return getattr(self.snapshot, kind)()
+        if self._listing is not None:
+            return self._listing(kind)
+        return list(iter_pages(getattr(self.api, LISTING_METHODS[kind]), self.page_size))
+
+    def directory(self, kind, refs, fields=None):
+        """
+        Return the roles or access groups matching refs, in the order of refs.
+
+        refs is a name or ID, a list of them, or a dict with 'name' and/or
+        'id' lists. Unmatched references are returned in 'missing'.
+        """
+        if isinstance(refs, dict):
+            wanted = [('name', ref) for ref in _as_list(refs.get('name'))]
+            wanted += [('id', ref) for ref in _as_list(refs.get('id'))]
+        else:
+            wanted = [(None, ref) for ref in _as_list(refs)]
+
+        names, ids = {}, {}
+        for item in self.listing(kind):
+            names.setdefault(item.get('name'), item)
+            ids[item.get('id')] = item
+
+        items, seen, missing = [], set(), []
+        for key, ref in wanted:
+            item = None
+            if key in (None, 'name'):
+                item = names.get(ref)
+            if item is None and key in (None, 'id'):
+                item = ids.get(ref)
+            if item is None:
+                missing.append(ref)
+            elif item.get('id') not in seen:
+                seen.add(item.get('id'))
+                items.append(project(item, DEFAULT_FIELDS[kind] if fields is None else fields))
+        return {'count': len(items), 'items': items, 'missing': missing}
+
+    def _search(self, criteria):
+        if self.snapshot is not None:
+            return self.snapshot.search_hosts(exact=True, **criteria)
+        return iter_pages(self.api.search_hosts, self.page_size, search_payload=criteria)
+
+    def _fetch_hosts(self, host_ids):
+        if self.snapshot is not None:
+            return {ident: self.snapshot.get_host(ident) for ident in host_ids}
+        if self._get_hosts is not None:
+            return self._get_hosts(host_ids)
+        hosts = {}
+        for ident in host_ids:
+            response = self.api.get_host(ident)
+            hosts[ident] = response.data if response.ok else None
+        return hosts
+
+    def list_hosts(self, fields=None):
+        """
+        Return every host projected to fields, streamed from the snapshot or one page at a time.
+
+        Only the projected fields of each host are kept, so memory use grows
+        with the fields requested rather than with full host data.
+        """
+        fields = DEFAULT_FIELDS['hosts'] if fields is None else fields
+        if self.snapshot is not None:
+            hosts = self.snapshot.iter_hosts()
+        else:
+            hosts = iter_pages(self.api.get_hosts, self.page_size)
+        items = list(iter_projected(hosts, fields))
+        return {'count': len(items), 'items': items}
+
+    def hosts(self, refs, fields=None):
+        """
+        Return the hosts matching refs.
+
+        refs is a common name or host ID, a list of them, or a dict of
+        'common_name', 'external_id', 'addresses' and 'id' lists. Search
+        criteria are pushed down to the host-store, which matches substrings,
+        and the results are narrowed to exact matches; hosts must match every
+        criterion given, and any of its values. Plain references that match no
+        common name are tried as host IDs.
+        """
+        fields = DEFAULT_FIELDS['hosts'] if fields is None else fields
+        if isinstance(refs, dict):
+            criteria = {key: _as_list(refs.get(key)) for key in HOST_SEARCH_KEYS if refs.get(key)}
+            host_ids = _as_list(refs.get('id'))
+            fallback = False
+        else:
+            criteria = {'common_name': _as_list(refs)} if refs else {}
+            host_ids = []
+            fallback = True
+
+        # Hosts are projected as they are found, so whole hosts are not kept
+        found, missing = {}, []
+        if criteria:
+            wanted = {key: set(str(value) for value in values) for key, values in criteria.items()}
+            matched = {key: set() for key in criteria}
+            for host in self._search(criteria):
+                hits = {key: wanted[key] & set(str(value) for value in _as_list(host.get(key))) for key in wanted}
+                if all(hits.values()) and host.get('id') not in found:
+                    found[host.get('id')] = project(host, fields)
+                    for key, values in hits.items():
+                        matched[key] |= values
+            for key, values in criteria.items():
+                unmatched = [value for value in values if str(value) not in matched[key]]
+                if fallback:
+                    host_ids = unmatched
+                else:
+                    missing.extend(unmatched)
+
+        if host_ids:
+            fetched = self._fetch_hosts(host_ids)
+            for ident in host_ids:
+                host = fetched.get(ident)
+                if host is None:
+                    missing.append(ident)
+                elif host.get('id') not in found:
+                    found[host.get('id')] = project(host, fields)
+
+        items = list(found.values())
+        return {'count': len(items), 'items': items, 'missing': missing}
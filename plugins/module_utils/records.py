@@ -0,0 +1,71 @@
+import threading
+
+# Fields kept for hosts that are only needed to be recognized, e.g. when looking for stale hosts.
+HOST_KEY_FIELDS = ('id', 'common_name', 'external_id')
+
+_RECORD_TYPES = {}
+_RECORD_TYPES_LOCK = threading.Lock()
+
+
+class HostRecord(tuple):
+    """
+    Compact, read-only host holding only some fields.
+
+    Records are tuples without a per-instance __dict__; a subclass per field
+    list, from host_record_type(), maps field names to positions. They support
+    the dict reads used on hosts (get, [], in, keys) and to_dict().
+    """
+
+    __slots__ = ()
+    _fields = ()
+    _positions = {}
+
+    @classmethod
+    def from_host(cls, host):
+        return tuple.__new__(cls, [host.get(field) for field in cls._fields])
+
+    def get(self, key, default=None):
+        position = self._positions.get(key)
+        if position is None:
+            return default
+        return tuple.__getitem__(self, position)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            position = self._positions.get(key)
+            if position is None:
+                raise KeyError(key)
+            return tuple.__getitem__(self, position)
+        return tuple.__getitem__(self, key)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def keys(self):
+        return list(self._fields)
+
+    def to_dict(self):
+        return dict(zip(self._fields, self))
+
+    def __repr__(self):
+        return 'HostRecord(%r)' % self.to_dict()
+
+
+def host_record_type(fields):
+    """Return the HostRecord subclass for a list of fields, creating it on first use."""
+    fields = tuple(fields)
+    with _RECORD_TYPES_LOCK:
+        record_type = _RECORD_TYPES.get(fields)
+        if record_type is None:
+            record_type = _RECORD_TYPES[fields] = type('HostRecord', (HostRecord,), {
+                '__slots__': (),
+                '_fields': fields,
+                '_positions': {field: position for position, field in enumerate(fields)},
+            })
+        return record_type
+
+
+def compact_host(host, fields=HOST_KEY_FIELDS):
+    """Return a HostRecord of host with only the given fields."""
+    return host_record_type(fields).from_host(host)
+
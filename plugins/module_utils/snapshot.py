@@ -0,0 +1,378 @@
+import calendar
+import inspect
+import json
+import os
+import re
+import time
+
+from ansible_collections.garnser.privx.plugins.module_utils.privx_utils import iter_pages, DEFAULT_PAGE_SIZE
+from ansible_collections.garnser.privx.plugins.module_utils.token_cache import token_cache_key
+
+HAS_SQLITE = True
+
+try:
+    import sqlite3
+except ImportError:
+    HAS_SQLITE = False
+
+DEFAULT_SNAPSHOT_DIR = '~/.ansible/tmp/privx_snapshots'
+DEFAULT_SNAPSHOT_MAX_AGE = 300
+# Hosts requested per page when looking for changes; most refreshes end on the first page.
+INCREMENTAL_PAGE_SIZE = 100
+# Seconds after which a refresh lists every host again, catching deletions counts cannot reveal.
+FULL_REFRESH_INTERVAL = 3600
+SCHEMA_VERSION = 2
+TABLES = ('meta', 'hosts', 'host_addresses', 'host_roles', 'roles', 'access_groups')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS hosts (
+    id TEXT PRIMARY KEY,
+    common_name TEXT,
+    external_id TEXT,
+    access_group_id TEXT,
+    updated TEXT,
+    updated_us INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hosts_common_name ON hosts (common_name);
+CREATE INDEX IF NOT EXISTS hosts_external_id ON hosts (external_id);
+CREATE TABLE IF NOT EXISTS host_addresses (host_id TEXT NOT NULL, address TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS host_addresses_address ON host_addresses (address);
+CREATE INDEX IF NOT EXISTS host_addresses_host ON host_addresses (host_id);
+CREATE TABLE IF NOT EXISTS host_roles (host_id TEXT NOT NULL, role_id TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS host_roles_role ON host_roles (role_id);
+CREATE INDEX IF NOT EXISTS host_roles_host ON host_roles (host_id);
+CREATE TABLE IF NOT EXISTS roles (id TEXT PRIMARY KEY, name TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS roles_name ON roles (name);
+CREATE TABLE IF NOT EXISTS access_groups (id TEXT PRIMARY KEY, name TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS access_groups_name ON access_groups (name);
+"""
+
+
+_TIMESTAMP_RE = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:[.,](\d+))?\s*(Z|[+-]\d{2}:?\d{2})?$', re.IGNORECASE
+)
+
+
+def parse_timestamp(value):
+    """
+    Return an ISO 8601 timestamp as microseconds since the epoch, or None if it cannot be parsed.
+
+    Any fraction precision and UTC offset are accepted; times without an
+    offset are taken as UTC.
+    """
+    match = _TIMESTAMP_RE.match(str(value or '').strip())
+    if not match:
+        return None
+    year, month, day, hour, minute, second, fraction, zone = match.groups()
+    seconds = calendar.timegm((int(year), int(month), int(day), int(hour), int(minute), int(second), 0, 0, 0))
+    if zone and zone.upper() != 'Z':
+        sign = -1 if zone[0] == '-' else 1
+        digits = zone[1:].replace(':', '')
+        seconds -= sign * (int(digits[:2]) * 3600 + int(digits[2:]) * 60)
+    return seconds * 1000000 + int((fraction or '0')[:6].ljust(6, '0'))
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'), sort_keys=True)
+
+
+def _host_role_ids(host):
+    return {
+        role.get('id')
+        for principal in host.get('principals') or []
+        for role in principal.get('roles') or []
+        if role.get('id')
+    }
+
+
+def _like(value):
+    # PrivX host search matches substrings, case-insensitively
+    return '%' + str(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+class PrivXSnapshot(object):
+    """
+    Local SQLite copy of PrivX hosts, roles and access groups.
+
+    Hosts are indexed by common name, external ID, address and role. Each
+    refresh only downloads hosts updated since the previous one, using the
+    host-store's 'updated' timestamps; a full download is made the first time,
+    whenever hosts have been deleted and every FULL_REFRESH_INTERVAL seconds.
+    """
+
+    def __init__(self, path, max_age=DEFAULT_SNAPSHOT_MAX_AGE):
+        if not HAS_SQLITE:
+            raise Exception("The PrivX snapshot requires the Python sqlite3 module.")
+        self.path = os.path.expanduser(path)
+        self.max_age = DEFAULT_SNAPSHOT_MAX_AGE if max_age is None else max_age
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        if not os.path.exists(self.path):
+            os.close(os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o600))
+        # Concurrent forks wait for each other's refresh instead of failing
+        self.db = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        if self._meta('schema_version') not in (None, str(SCHEMA_VERSION)):
+            self._reset()
+        self._set_meta('schema_version', SCHEMA_VERSION)
+
+    @classmethod
+    def for_config(cls, config):
+        """Return the snapshot for config, or None unless config.snapshot is enabled."""
+        if not config.get('snapshot'):
+            return None
+        path = config.get('snapshot_path') or os.path.join(
+            DEFAULT_SNAPSHOT_DIR, token_cache_key(config)[:16] + '.db'
+        )
+        return cls(path, config.get('snapshot_max_age'))
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _reset(self):
+        # Tables are recreated, as older schema versions lack columns
+        for table in TABLES:
+            self.db.execute("DROP TABLE IF EXISTS %s" % table)
+        self.db.executescript(SCHEMA)
+
+    @property
+    def synced_at(self):
+        value = self._meta('synced_at')
+        return float(value) if value else None
+
+    def is_fresh(self, max_age=None):
+        max_age = self.max_age if max_age is None else max_age
+        synced_at = self.synced_at
+        return synced_at is not None and time.time() - synced_at < max_age
+
+    # Refresh
+
+    def _put_host(self, host):
+        host_id = host.get('id')
+        self.db.execute("DELETE FROM host_addresses WHERE host_id = ?", (host_id,))
+        self.db.execute("DELETE FROM host_roles WHERE host_id = ?", (host_id,))
+        self.db.execute(
+            "INSERT OR REPLACE INTO hosts (id, common_name, external_id, access_group_id, updated, updated_us, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (host_id, host.get('common_name'), host.get('external_id') or None,
+             host.get('access_group_id') or None, host.get('updated'), parse_timestamp(host.get('updated')),
+             _dumps(host))
+        )
+        self.db.executemany(
+            "INSERT INTO host_addresses (host_id, address) VALUES (?, ?)",
+            [(host_id, address) for address in set(host.get('addresses') or [])]
+        )
+        self.db.executemany(
+            "INSERT INTO host_roles (host_id, role_id) VALUES (?, ?)",
+            [(host_id, role_id) for role_id in _host_role_ids(host)]
+        )
+
+    def _known(self, host):
+        row = self.db.execute("SELECT updated FROM hosts WHERE id = ?", (host.get('id'),)).fetchone()
+        return row is not None and row[0] == host.get('updated')
+
+    def _host_count(self):
+        return self.db.execute("SELECT COUNT(*) FROM hosts").fetchone()[0]
+
+    def _full_hosts(self, api, page_size):
+        seen = set()
+        self.db.execute("CREATE TEMP TABLE IF NOT EXISTS seen_hosts (id TEXT PRIMARY KEY)")
+        self.db.execute("DELETE FROM seen_hosts")
+        for host in iter_pages(api.get_hosts, page_size):
+            if host.get('id') in seen:
+                continue
+            seen.add(host.get('id'))
+            self.db.execute("INSERT INTO seen_hosts (id) VALUES (?)", (host.get('id'),))
+            self._put_host(host)
+        removed = self.db.execute("SELECT COUNT(*) FROM hosts WHERE id NOT IN (SELECT id FROM seen_hosts)").fetchone()[0]
+        for table, column in (('host_addresses', 'host_id'), ('host_roles', 'host_id'), ('hosts', 'id')):
+            self.db.execute("DELETE FROM %s WHERE %s NOT IN (SELECT id FROM seen_hosts)" % (table, column))
+        return {'hosts_fetched': len(seen), 'hosts_removed': removed}
+
+    def _incremental_hosts(self, api, watermark):
+        """
+        Fetch hosts newest first until one already in the snapshot at its
+        current version, and no newer than the watermark, shows up.
+
+        Returns None when a full refresh is needed: when an 'updated' timestamp
+        cannot be parsed, or when PrivX does not report its host count or it
+        differs from the snapshot's, meaning hosts were deleted. As every host
+        created since the watermark has been fetched, matching counts prove
+        nothing was deleted.
+        """
+        fetched = 0
+        offset = 0
+        remote_count = None
+        while True:
+            response = api.get_hosts(offset=offset, limit=INCREMENTAL_PAGE_SIZE, sort_key='updated', sort_dir='DESC')
+            if not response.ok:
+                raise Exception("PrivX API request failed with status {}: {}".format(response.status, response.data))
+            data = response.data or {}
+            items = data.get('items') or []
+            if remote_count is None:
+                remote_count = data.get('count')
+            done = len(items) < INCREMENTAL_PAGE_SIZE
+            for host in items:
+                updated = parse_timestamp(host.get('updated'))
+                if updated is None:
+                    return None
+                if updated < watermark or (updated == watermark and self._known(host)):
+                    done = True
+                    break
+                self._put_host(host)
+                fetched += 1
+            offset += len(items)
+            if done:
+                break
+        if remote_count is None or remote_count != self._host_count():
+            return None
+        return {'hosts_fetched': fetched, 'hosts_removed': 0}
+
+    def _replace_directory(self, table, items):
+        self.db.execute("DELETE FROM %s" % table)
+        self.db.executemany(
+            "INSERT OR REPLACE INTO %s (id, name, data) VALUES (?, ?, ?)" % table,
+            [(item.get('id'), item.get('name'), _dumps(item)) for item in items]
+        )
+
+    def refresh(self, api, full=False, page_size=DEFAULT_PAGE_SIZE):
+        """
+        Bring the snapshot up to date with PrivX and return what was done.
+
+        Hosts are always brought up to date; roles and access groups, which
+        carry no update timestamps, are downloaded again only on a full refresh
+        or once they are older than max_age. The refresh runs in a single write
+        transaction, so readers in other processes never see it half-applied.
+        """
+        started = time.time()
+        full_synced_at = self._meta('hosts_full_synced_at')
+        full = full or not full_synced_at or started - float(full_synced_at) >= FULL_REFRESH_INTERVAL
+        directory_synced_at = self._meta('directory_synced_at')
+        directory = full or not directory_synced_at or started - float(directory_synced_at) >= self.max_age
+        if directory:
+            roles = list(iter_pages(api.get_roles, page_size))
+            access_groups = list(iter_pages(api.get_access_groups, page_size))
+
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            watermark = self._meta('hosts_watermark')
+            try:
+                sortable = 'sort_key' in inspect.signature(api.get_hosts).parameters
+            except (TypeError, ValueError):
+                sortable = False
+
+            summary = None
+            if not full and watermark and sortable:
+                summary = self._incremental_hosts(api, int(watermark))
+                if summary is not None:
+                    summary['full'] = False
+            if summary is None:
+                summary = self._full_hosts(api, page_size)
+                summary['full'] = True
+                self._set_meta('hosts_full_synced_at', started)
+
+            if directory:
+                self._replace_directory('roles', roles)
+                self._replace_directory('access_groups', access_groups)
+                self._set_meta('directory_synced_at', started)
+            latest = self.db.execute("SELECT MAX(updated_us) FROM hosts").fetchone()[0]
+            if latest is not None:
+                self._set_meta('hosts_watermark', latest)
+            self._set_meta('synced_at', started)
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        summary['hosts'] = self._host_count()
+        return summary
+
+    def sync(self, api, max_age=None):
+        """Refresh the snapshot unless it was refreshed within max_age seconds; returns True if it refreshed."""
+        if self.is_fresh(max_age):
+            return False
+        self.refresh(api)
+        return True
+
+    # Reads
+
+    def _hosts(self, where='', args=()):
+        query = "SELECT data FROM hosts"
+        if where:
+            query += " WHERE " + where
+        for (data,) in self.db.execute(query + " ORDER BY common_name", args):
+            yield json.loads(data)
+
+    def iter_hosts(self):
+        """Yield every host, one row at a time."""
+        return self._hosts()
+
+    def get_host(self, host_id):
+        row = self.db.execute("SELECT data FROM hosts WHERE id = ?", (host_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find_host(self, common_name):
+        """Return the host with exactly this common name, or None."""
+        return next(self._hosts("common_name = ?", (common_name,)), None)
+
+    def search_hosts(self, common_name=None, external_id=None, addresses=None, role_id=None, exact=False):
+        """
+        Yield hosts matching all given criteria.
+
+        Like the PrivX host search, values match substrings case-insensitively
+        unless exact is set; addresses matches any of the given addresses.
+        """
+        clauses, args = [], []
+        op = "= ?" if exact else "LIKE ? ESCAPE '\\'"
+
+        def value(v):
+            return v if exact else _like(v)
+
+        for column, values in (('common_name', common_name), ('external_id', external_id)):
+            if values:
+                values = values if isinstance(values, list) else [values]
+                clauses.append("(" + " OR ".join("%s %s" % (column, op) for v in values) + ")")
+                args.extend(value(v) for v in values)
+        if addresses:
+            addresses = addresses if isinstance(addresses, list) else [addresses]
+            clauses.append("id IN (SELECT host_id FROM host_addresses WHERE "
+                           + " OR ".join("address %s" % op for a in addresses) + ")")
+            args.extend(value(a) for a in addresses)
+        if role_id:
+            clauses.append("id IN (SELECT host_id FROM host_roles WHERE role_id = ?)")
+            args.append(role_id)
+        return self._hosts(" AND ".join(clauses), args)
+
+    def hosts_by_common_name(self):
+        """Return all hosts keyed by common name."""
+        index = {}
+        for host in self._hosts():
+            index.setdefault(host.get('common_name'), host)
+        return index
+
+    def roles(self):
+        return [json.loads(data) for (data,) in self.db.execute("SELECT data FROM roles ORDER BY name")]
+
+    def access_groups(self):
+        return [json.loads(data) for (data,) in self.db.execute("SELECT data FROM access_groups ORDER BY name")]
+
+    def counts(self):
+        return {
+            table: self.db.execute("SELECT COUNT(*) FROM %s" % table).fetchone()[0]
+            for table in ('hosts', 'roles', 'access_groups')
+        }
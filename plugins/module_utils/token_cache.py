@@ -0,0 +1,169 @@
+import base64
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+DEFAULT_TOKEN_CACHE_DIR = '~/.ansible/tmp/privx_tokens'
+# Lifetime assumed for tokens that do not carry an 'exp' claim.
+DEFAULT_TOKEN_LIFETIME = 300
+# Tokens are refreshed this many seconds before they expire.
+DEFAULT_REFRESH_MARGIN = 30
+
+
+def token_cache_key(config):
+    """Return the cache key for a PrivX config: instance plus OAuth and API client."""
+    identity = [
+        config.get('hostname', ''),
+        str(config.get('hostport', '')),
+        config.get('oauth_client_id', ''),
+        config.get('api_client_id', ''),
+    ]
+    return hashlib.sha256(json.dumps(identity).encode('utf-8')).hexdigest()
+
+
+def token_expiry(token, default_lifetime=DEFAULT_TOKEN_LIFETIME):
+    """Return the expiry timestamp of a token, read from its JWT 'exp' claim when present."""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload.encode('ascii')))
+        return float(claims['exp'])
+    except Exception:
+        return time.time() + default_lifetime
+
+
+class PrivXTokenCache(object):
+    """File-locked, owner-only on-disk cache of PrivX access tokens."""
+
+    def __init__(self, cache_dir=None, refresh_margin=DEFAULT_REFRESH_MARGIN,
+                 default_lifetime=DEFAULT_TOKEN_LIFETIME):
+        self.cache_dir = os.path.expanduser(cache_dir or DEFAULT_TOKEN_CACHE_DIR)
+        self.refresh_margin = refresh_margin
+        self.default_lifetime = default_lifetime
+
+    @property
+    def usable(self):
+        """Whether the cache directory can be used safely on this controller."""
+        if not HAS_FCNTL:
+            return False
+        try:
+            os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+            st = os.stat(self.cache_dir)
+        except OSError:
+            return False
+        # Refuse directories that other users could read or plant tokens in.
+        return st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    @contextmanager
+    def _lock(self, key):
+        fd = os.open(os.path.join(self.cache_dir, key + '.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _entry(self, key):
+        try:
+            with open(self._path(key), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _read(self, key):
+        entry = self._entry(key)
+        if entry is None:
+            return None
+        if entry.get('expires_at', 0) - self.refresh_margin <= time.time():
+            return None
+        return entry.get('access_token')
+
+    def _write(self, key, token):
+        path = self._path(key)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({
+                'access_token': token,
+                'expires_at': token_expiry(token, self.default_lifetime),
+            }, f)
+        os.replace(tmp_path, path)
+
+    def get(self, key):
+        """Return a cached token that is not about to expire, or None."""
+        with self._lock(key):
+            return self._read(key)
+
+    def invalidate(self, key, token=None):
+        """
+        Drop a cached token, e.g. after the server rejected it.
+
+        With token, the cached token is only dropped if it is still that one,
+        so a token another process has just requested is kept.
+        """
+        with self._lock(key):
+            entry = self._entry(key)
+            if token is not None and (entry or {}).get('access_token') != token:
+                return
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+
+    def authenticate(self, privx, config):
+        """
+        Authenticate a privx_api.PrivXAPI object, reusing a cached token when possible.
+
+        The lock is held across the OAuth request so that concurrent forks wait
+        for a single authentication instead of each requesting their own token.
+        Returns True if a new token was requested from PrivX.
+        """
+        key = token_cache_key(config)
+        with self._lock(key):
+            token = self._read(key)
+            if token:
+                privx._access_token = token
+                return False
+            privx.authenticate(
+                config.get('api_client_id', ''),
+                config.get('api_client_secret', '')
+            )
+            token = getattr(privx, '_access_token', None)
+            if token:
+                self._write(key, token)
+            return True
+
+
+def authenticate_privx_api(privx, config):
+    """Authenticate through the token cache unless it is disabled or unusable."""
+    if config.get('token_cache', True):
+        cache = PrivXTokenCache(config.get('token_cache_dir'))
+        if cache.usable:
+            return cache.authenticate(privx, config)
+    privx.authenticate(
+        config.get('api_client_id', ''),
+        config.get('api_client_secret', '')
+    )
+    return True
+
+
+def reauthenticate_privx_api(privx, config):
+    """Authenticate again after PrivX rejected the current access token, dropping it from the cache first."""
+    rejected = getattr(privx, '_access_token', None)
+    if config.get('token_cache', True):
+        cache = PrivXTokenCache(config.get('token_cache_dir'))
+        if cache.usable:
+            cache.invalidate(token_cache_key(config), rejected or None)
+    return authenticate_privx_api(privx, config)
@@ -0,0 +1,107 @@
+from ansible_collections.garnser.privx.plugins.module_utils.privx_utils import PrivXAnsibleModule, DEFAULT_PAGE_SIZE
+from ansible_collections.garnser.privx.plugins.module_utils.host_store import (
+    PrivXHostStore, PrivXPruneLimitError, get_host_data_options, DEFAULT_CONCURRENCY, DEFAULT_MAX_DELETIONS, PRUNE_KEYS
+)
+from ansible_collections.garnser.privx.plugins.module_utils.directory import PrivXDirectory
+from ansible_collections.garnser.privx.plugins.module_utils.fingerprint import get_fingerprint_spec, get_fingerprint_store
+from ansible_collections.garnser.privx.plugins.module_utils.snapshot import PrivXSnapshot
+
+
+def main():
+    hosts_spec = {
+        'hosts': {
+            'type': 'list',
+            'elements': 'dict',
+            'required': False,
+            'default': [],
+            'options': get_host_data_options()
+        },
+        'concurrency': {'type': 'int', 'required': False, 'default': DEFAULT_CONCURRENCY},
+        'page_size': {'type': 'int', 'required': False, 'default': DEFAULT_PAGE_SIZE},
+        'prune': {'type': 'bool', 'required': False, 'default': False},
+        'prune_by': {'type': 'str', 'required': False, 'default': 'common_name', 'choices': PRUNE_KEYS},
+        'keep': {'type': 'list', 'elements': 'str', 'required': False, 'default': []},
+        'max_deletions': {'type': 'int', 'required': False, 'default': DEFAULT_MAX_DELETIONS},
+    }
+    hosts_spec.update(get_fingerprint_spec())
+
+    privx_module = PrivXAnsibleModule(hosts_spec)
+    module = privx_module.module
+    api = privx_module.api
+
+    try:
+        snapshot = PrivXSnapshot.for_config(privx_module.config)
+    except Exception as e:
+        module.fail_json(msg=f"Failed to open the PrivX snapshot: {e}")
+
+    hoststore = PrivXHostStore(
+        api,
+        PrivXDirectory.get(api, privx_module.config),
+        page_size=module.params['page_size'],
+        snapshot=snapshot
+    )
+
+    fingerprints = get_fingerprint_store(module.params)
+    try:
+        hosts, summary = hoststore.reconcile(
+            module.params['hosts'],
+            concurrency=module.params['concurrency'],
+            check_mode=module.check_mode,
+            fingerprint_mode=module.params['fingerprint'],
+            fingerprints=fingerprints,
+            fingerprint_max_age=module.params['fingerprint_max_age'],
+            # Prune reuses the listing of existing hosts
+            keep_index=module.params['prune']
+        )
+    except Exception as e:
+        module.fail_json(**privx_module.add_api_stats({'msg': f"Failed to reconcile hosts: {e}"}))
+
+    result = {
+        'changed': summary['created'] + summary['updated'] > 0,
+        'failed': summary['failed'] > 0,
+        'msg': "{created} created, {updated} updated, {unchanged} unchanged, {failed} failed.".format(**summary),
+        'hosts': hosts,
+        'summary': summary,
+    }
+
+    if module.params['prune']:
+        # Hosts that failed to reconcile are still desired
+        key = module.params['prune_by']
+        desired = {host[key] for host in module.params['hosts'] if host.get(key)}
+        desired.update(module.params['keep'])
+        try:
+            pruned, prune_summary = hoststore.prune(
+                desired,
+                key=key,
+                max_deletions=module.params['max_deletions'],
+                concurrency=module.params['concurrency'],
+                check_mode=module.check_mode,
+                fingerprints=fingerprints
+            )
+        except PrivXPruneLimitError as e:
+            result.update(failed=True, pruned=e.results, msg=f"{result['msg']} {e}")
+            pruned, prune_summary = None, None
+        except Exception as e:
+            result.update(failed=True, msg=f"{result['msg']} Failed to prune hosts: {e}")
+            pruned, prune_summary = None, None
+        if pruned is not None:
+            summary['prune'] = prune_summary
+            result['pruned'] = pruned
+            result['changed'] = result['changed'] or prune_summary['deleted'] + prune_summary['would_delete'] > 0
+            result['failed'] = result['failed'] or prune_summary['failed'] > 0
+            if module.check_mode:
+                result['msg'] += " {} would be deleted.".format(prune_summary['would_delete'])
+            else:
+                result['msg'] += " {} deleted, {} failed to delete.".format(
+                    prune_summary['deleted'], prune_summary['failed']
+                )
+
+    privx_module.add_api_stats(result)
+
+    if result['failed']:
+        module.fail_json(**result)
+    else:
+        module.exit_json(**result)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import json
+import shutil
+import socket
+import ssl
+import subprocess
+import threading
+
+import pytest
+
+from ansible_collections.garnser.privx.plugins.module_utils.async_client import PrivXAsyncClient, PrivXSyncFacade
+from ansible_collections.garnser.privx.plugins.module_utils.governor import PrivXRequestGovernor
+
+
+def _reply(status, data=None, headers=None, chunked=False):
+    body = json.dumps(data).encode('utf-8') if data is not None else b''
+    lines = ['HTTP/1.1 %d X' % status]
+    lines.extend('%s: %s' % item for item in (headers or {}).items())
+    if chunked:
+        lines.append('Transfer-Encoding: chunked')
+        half = len(body) // 2
+        body = b''.join(b'%x\r\n%s\r\n' % (len(part), part) for part in (body[:half], body[half:]) if part)
+        body += b'0\r\n\r\n'
+    else:
+        lines.append('Content-Length: %d' % len(body))
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+
+class _Server(object):
+    """
+    Local HTTPS server answering each request with handler(method, path, body).
+
+    The handler returns the raw response, or a (response, close) tuple to
+    close the connection after sending it without saying so.
+    """
+
+    def __init__(self, directory, handler):
+        if shutil.which('openssl') is None:
+            pytest.skip('openssl is needed to create a test certificate')
+        cert, key = str(directory / 'test.crt'), str(directory / 'test.key')
+        subprocess.run(
+            ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+             '-subj', '/CN=localhost', '-addext', 'subjectAltName=IP:127.0.0.1',
+             '-keyout', key, '-out', cert],
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        with open(cert) as f:
+            self.ca_cert = f.read()
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(cert, key)
+        self.handler = handler
+        self.requests = []
+        self.connections = 0
+        self.sock = socket.create_server(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            conn = self.context.wrap_socket(conn, server_side=True)
+            reader = conn.makefile('rb')
+            while True:
+                line = reader.readline()
+                if not line:
+                    return
+                method, path, _ = line.decode('latin-1').split(' ', 2)
+                length = 0
+                while True:
+                    line = reader.readline()
+                    if line in (b'\r\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    if name.strip().lower() == 'content-length':
+                        length = int(value)
+                body = reader.read(length) if length else b''
+                self.requests.append((method, path))
+                response = self.handler(method, path, body)
+                close = False
+                if isinstance(response, tuple):
+                    response, close = response
+                conn.sendall(response)
+                if close:
+                    return
+        except (OSError, ValueError):
+            return
+        finally:
+            conn.close()
+
+    def facade(self, governor=None, concurrency=4):
+        return PrivXSyncFacade(PrivXAsyncClient(
+            '127.0.0.1', self.port, self.ca_cert, 'client', 'secret', concurrency=concurrency, governor=governor,
+        ))
+
+    def close(self):
+        self.sock.close()
+
+
+def _governor(max_retries=2):
+    return PrivXRequestGovernor(max_retries=max_retries, backoff=0, breaker_threshold=0)
+
+
+def test_parses_content_length_and_chunked_responses_over_one_connection(tmp_path):
+    server = _Server(tmp_path, lambda method, path, body: _reply(
+        200, {'id': path.rsplit('/', 1)[1]}, chunked=path.endswith('chunked')
+    ))
+    api = server.facade()
+    try:
+        plain = api.get_host('plain')
+        chunked = api.get_host('chunked')
+    finally:
+        api.close()
+        server.close()
+
+    assert plain.ok and plain.data == {'id': 'plain'}
+    assert chunked.ok and chunked.data == {'id': 'chunked'}
+    assert server.connections == 1
+
+
+def test_reconnects_when_an_idle_connection_was_closed(tmp_path):
+    server = _Server(tmp_path, lambda method, path, body: (_reply(200, {'id': 'h1'}), True))
+    api = server.facade()
+    try:
+        first = api.get_host('h1')
+        second = api.get_host('h1')
+    finally:
+        api.close()
+        server.close()
+
+    assert first.ok and second.ok
+    assert server.connections == 2
+
+
+def test_throttled_request_is_retried_after_retry_after(tmp_path):
+    statuses = iter([429, 429, 200])
+    server = _Server(tmp_path, lambda method, path, body: _reply(next(statuses), {}, {'Retry-After': '0'}))
+    api = server.facade(_governor())
+    try:
+        response = api.get_host('h1')
+    finally:
+        api.close()
+        server.close()
+
+    assert response.status == 200
+    assert response.retries == 2
+    assert len(server.requests) == 3
+
+
+def test_gateway_error_is_retried_only_for_idempotent_calls(tmp_path):
+    server = _Server(tmp_path, lambda method, path, body: _reply(502, {}))
+    api = server.facade(_governor(max_retries=1))
+    try:
+        created = api.create_host({'common_name': 'h1'})
+        requests_for_create = len(server.requests)
+        fetched = api.get_host('h1')
+    finally:
+        api.close()
+        server.close()
+
+    assert created.status == 502 and not created.ok
+    assert requests_for_create == 1
+    assert fetched.status == 502
+    assert len(server.requests) == 3
+
+
+def test_iter_all_follows_the_page_size_capped_by_the_server(tmp_path):
+    hosts = [{'id': 'h%d' % i} for i in range(7)]
+
+    def handler(method, path, body):
+        query = dict(part.split('=') for part in path.split('?', 1)[1].split('&'))
+        offset, limit = int(query['offset']), min(int(query['limit']), 2)
+        return _reply(200, {'count': len(hosts), 'items': hosts[offset:offset + limit]})
+
+    server = _Server(tmp_path, handler)
+    api = server.facade()
+    try:
+        listed = list(api.iter_all('get_hosts', page_size=5, window=3))
+    finally:
+        api.close()
+        server.close()
+
+    assert listed == hosts
+    assert len(server.requests) == 4
@@ -0,0 +1,136 @@
+import pytest
+
+from ansible_collections.garnser.privx.plugins.module_utils import directory as directory_module
+from ansible_collections.garnser.privx.plugins.module_utils.directory import PrivXDirectory
+
+
+class _Response(object):
+
+    def __init__(self, data):
+        self.ok = True
+        self.status = 200
+        self.data = data
+
+
+class _FakeAPI(object):
+    """Role and access group listings counting the requests made."""
+
+    def __init__(self):
+        self.roles = [{'id': 'r1', 'name': 'admins'}, {'id': 'r2', 'name': 'users'}]
+        self.access_groups = [{'id': 'ag1', 'name': 'Default'}]
+        self.requests = 0
+
+    def _page(self, items, offset, limit):
+        self.requests += 1
+        return _Response({'count': len(items), 'items': items[offset:offset + limit]})
+
+    def get_roles(self, offset=0, limit=50):
+        return self._page(self.roles, offset, limit)
+
+    def get_access_groups(self, offset=0, limit=50):
+        return self._page(self.access_groups, offset, limit)
+
+
+class _Clock(object):
+
+    def __init__(self):
+        self.now = 1700000000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(directory_module.time, 'time', clock.time)
+    return clock
+
+
+def _config(tmp_path, hostname='privx.example.com'):
+    return {
+        'hostname': hostname,
+        'hostport': 443,
+        'oauth_client_id': 'privx-external',
+        'api_client_id': 'client',
+        'directory_cache_dir': str(tmp_path),
+    }
+
+
+def test_batch_of_names_and_ids_is_resolved_with_one_listing(clock):
+    api = _FakeAPI()
+    directory = PrivXDirectory(api)
+
+    ids = directory.resolve_roles(['admins', {'id': 'r2'}, {'name': 'admins'}, 'r1'])
+    directory.resolve_roles(['users'])
+
+    assert ids == ['r1', 'r2', 'r1', 'r1']
+    assert api.requests == 1
+
+
+def test_index_is_fetched_again_after_the_ttl(clock):
+    api = _FakeAPI()
+    directory = PrivXDirectory(api, ttl=300)
+    directory.resolve_access_group('Default')
+
+    clock.now += 299
+    directory.resolve_access_group('Default')
+    assert api.requests == 1
+
+    clock.now += 1
+    directory.resolve_access_group('Default')
+    assert api.requests == 2
+
+
+def test_unknown_name_refreshes_the_index_once(clock):
+    api = _FakeAPI()
+    directory = PrivXDirectory(api)
+    directory.resolve_roles(['admins'])
+    api.roles.append({'id': 'r3', 'name': 'auditors'})
+    clock.now += 5
+
+    assert directory.resolve_roles(['admins', 'auditors']) == ['r1', 'r3']
+    assert api.requests == 2
+
+    clock.now += 5
+    with pytest.raises(Exception, match='No matching role found for input: nobody'):
+        directory.resolve_roles(['nobody'])
+    assert api.requests == 3
+
+
+def test_unknown_name_does_not_refresh_a_just_fetched_index(clock):
+    api = _FakeAPI()
+    directory = PrivXDirectory(api)
+
+    with pytest.raises(Exception, match=r"No matching role found for input: \['x', 'y'\]"):
+        directory.resolve_roles(['admins', 'x', 'y'])
+    assert api.requests == 1
+
+
+def test_on_disk_cache_is_shared_per_instance(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(directory_module, '_DIRECTORIES', {})
+    api = _FakeAPI()
+    PrivXDirectory.get(api, _config(tmp_path)).resolve_roles(['admins'])
+
+    # A new process reads the index written by the previous one
+    monkeypatch.setattr(directory_module, '_DIRECTORIES', {})
+    other = _FakeAPI()
+    assert PrivXDirectory.get(other, _config(tmp_path)).resolve_roles(['users']) == ['r2']
+    assert other.requests == 0
+
+    # Another PrivX instance does not share it
+    PrivXDirectory.get(other, _config(tmp_path, 'other.example.com')).resolve_roles(['users'])
+    assert other.requests == 1
+    assert len(list(tmp_path.glob('*.roles.json'))) == 2
+
+
+def test_on_disk_cache_older_than_the_ttl_is_ignored(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(directory_module, '_DIRECTORIES', {})
+    PrivXDirectory.get(_FakeAPI(), _config(tmp_path)).resolve_roles(['admins'])
+
+    monkeypatch.setattr(directory_module, '_DIRECTORIES', {})
+    clock.now += 300
+    other = _FakeAPI()
+    PrivXDirectory.get(other, _config(tmp_path)).resolve_roles(['admins'])
+
+    assert other.requests == 1
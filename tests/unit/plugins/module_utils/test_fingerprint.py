@@ -0,0 +1,37 @@
+import os
+import stat
+import time
+
+from ansible_collections.garnser.privx.plugins.module_utils.fingerprint import (
+    PrivXFingerprintStore,
+    fingerprint_tag,
+    fingerprint_tag_matches,
+    with_fingerprint_tag,
+)
+
+
+def test_fingerprint_tag_expires_after_max_age():
+    host = with_fingerprint_tag({'tags': ['web']}, 'abc')
+
+    assert fingerprint_tag(host) == 'abc'
+    assert 'web' in host['tags']
+    assert fingerprint_tag_matches(host, 'abc', max_age=60)
+    assert not fingerprint_tag_matches(host, 'other', max_age=60)
+
+    host['tags'] = ['ansible-fingerprint:abc:%d' % (time.time() - 120)]
+    assert not fingerprint_tag_matches(host, 'abc', max_age=60)
+
+
+def test_fingerprint_tag_without_time_is_verified_again():
+    host = {'tags': ['ansible-fingerprint:abc']}
+
+    assert fingerprint_tag(host) == 'abc'
+    assert not fingerprint_tag_matches(host, 'abc')
+
+
+def test_state_records_are_owner_only(tmp_path):
+    store = PrivXFingerprintStore({'hostname': 'privx.example.com'}, str(tmp_path), max_age=60)
+    store.put('web1.example.com', 'abc', 'host-1')
+
+    assert store.get('web1.example.com', 'abc')['id'] == 'host-1'
+    assert stat.S_IMODE(os.stat(store._path('web1.example.com')).st_mode) == 0o600
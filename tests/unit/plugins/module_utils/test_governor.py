@@ -0,0 +1,205 @@
+import email.utils
+
+import pytest
+
+from ansible_collections.garnser.privx.plugins.module_utils import governor as governor_module
+from ansible_collections.garnser.privx.plugins.module_utils.governor import (
+    CircuitBreaker,
+    PrivXCircuitOpenError,
+    PrivXRequestGovernor,
+    TokenBucket,
+    note_retry_after,
+    parse_retry_after,
+)
+
+
+class _Response(object):
+
+    def __init__(self, status):
+        self.ok = status < 400
+        self.status = status
+        self.data = {}
+
+
+class _Clock(object):
+    """Stands in for time.monotonic and time.sleep, advancing only when slept."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(governor_module.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(governor_module.time, 'sleep', clock.sleep)
+    return clock
+
+
+def _scripted(statuses, retry_after=None):
+    """Return a call answering with each status in turn, and the list of calls made."""
+    statuses = iter(statuses)
+    calls = []
+
+    def call():
+        calls.append(1)
+        note_retry_after(retry_after)
+        return _Response(next(statuses))
+    return call, calls
+
+
+def test_parse_retry_after_accepts_seconds_and_http_dates():
+    now = 1700000000.0
+
+    assert parse_retry_after('7') == 7.0
+    assert parse_retry_after(email.utils.formatdate(now + 30, usegmt=True), now=now) == 30.0
+    assert parse_retry_after(email.utils.formatdate(now - 30, usegmt=True), now=now) == 0.0
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(None) is None
+
+
+def test_throttled_call_waits_as_long_as_retry_after_asks(clock):
+    governor = PrivXRequestGovernor(max_retries=3, backoff=0.5)
+    call, calls = _scripted([429, 429, 200], retry_after='4')
+
+    response = governor.call('get_host', call)
+
+    assert response.status == 200
+    assert len(calls) == 3
+    assert clock.sleeps == [4.0, 4.0]
+
+
+def test_retry_after_is_capped_by_backoff_max(clock):
+    governor = PrivXRequestGovernor(max_retries=1, backoff_max=10)
+    call, calls = _scripted([503, 200], retry_after='3600')
+
+    governor.call('get_host', call)
+
+    assert clock.sleeps == [10]
+
+
+def test_throttled_calls_are_retried_even_when_not_idempotent(clock):
+    governor = PrivXRequestGovernor(max_retries=2, backoff=0)
+    call, calls = _scripted([429, 201])
+
+    response = governor.call('create_host', call)
+
+    assert response.status == 201
+    assert len(calls) == 2
+
+
+def test_gateway_errors_are_not_retried_for_create_calls(clock):
+    governor = PrivXRequestGovernor(max_retries=3, backoff=0)
+    create, creates = _scripted([502, 201])
+    fetch, fetches = _scripted([502, 502, 200])
+
+    created = governor.call('create_host', create)
+    fetched = governor.call('get_host', fetch)
+
+    assert created.status == 502
+    assert len(creates) == 1
+    assert fetched.status == 200
+    assert len(fetches) == 3
+
+
+def test_last_response_is_returned_once_retries_run_out(clock):
+    governor = PrivXRequestGovernor(max_retries=2, backoff=0, breaker_threshold=0)
+    call, calls = _scripted([503, 503, 503, 200])
+
+    response = governor.call('get_host', call)
+
+    assert response.status == 503
+    assert len(calls) == 3
+
+
+def test_connection_errors_are_retried_and_raised_when_retries_run_out(clock):
+    governor = PrivXRequestGovernor(max_retries=1, backoff=0, breaker_threshold=0)
+    calls = []
+
+    def call():
+        calls.append(1)
+        raise ConnectionResetError('reset')
+
+    with pytest.raises(ConnectionResetError):
+        governor.call('get_host', call)
+    assert len(calls) == 2
+
+
+def test_breaker_opens_after_threshold_failures_and_recovers_after_a_successful_trial(clock):
+    breaker = CircuitBreaker(threshold=2, cooldown=30)
+
+    breaker.failure()
+    breaker.before_call()
+    breaker.failure()
+    with pytest.raises(PrivXCircuitOpenError):
+        breaker.before_call()
+
+    clock.now += 30
+    breaker.before_call()
+    # Only one trial call is let through while it is in flight
+    with pytest.raises(PrivXCircuitOpenError):
+        breaker.before_call()
+    breaker.success()
+
+    breaker.before_call()
+    assert breaker.failures == 0
+    assert breaker.opened_at is None
+
+
+def test_breaker_reopens_after_a_failed_trial(clock):
+    breaker = CircuitBreaker(threshold=2, cooldown=30)
+    breaker.failure()
+    breaker.failure()
+    clock.now += 30
+
+    breaker.before_call()
+    breaker.failure()
+
+    with pytest.raises(PrivXCircuitOpenError):
+        breaker.before_call()
+    clock.now += 29
+    with pytest.raises(PrivXCircuitOpenError):
+        breaker.before_call()
+    clock.now += 1
+    breaker.before_call()
+
+
+def test_open_breaker_stops_calls_through_the_governor(clock):
+    governor = PrivXRequestGovernor(max_retries=0, breaker_threshold=1, breaker_cooldown=30)
+    call, calls = _scripted([503, 200])
+
+    governor.call('get_host', call)
+    with pytest.raises(PrivXCircuitOpenError):
+        governor.call('get_host', call)
+    clock.now += 30
+    response = governor.call('get_host', call)
+
+    assert response.status == 200
+    assert len(calls) == 2
+
+
+def test_token_bucket_paces_calls_after_the_burst(clock):
+    bucket = TokenBucket(rate=4, burst=2)
+
+    for _ in range(4):
+        bucket.acquire()
+
+    assert clock.sleeps == [0.25, 0.25]
+    assert bucket.reserve() == 0.25
+
+
+def test_token_bucket_without_rate_never_waits(clock):
+    bucket = TokenBucket()
+
+    for _ in range(100):
+        bucket.acquire()
+
+    assert clock.sleeps == []
@@ -0,0 +1,102 @@
+from ansible_collections.garnser.privx.plugins.module_utils.diff import diff_values
+from ansible_collections.garnser.privx.plugins.module_utils.host_store import PrivXHostStore
+
+
+def _host(roles):
+    return {
+        'id': 'host-1',
+        'common_name': 'web1.example.com',
+        'principals': [{'principal': 'root', 'passphrase': '', 'use_user_account': False, 'source': 'UI',
+                        'roles': roles}],
+    }
+
+
+def test_merge_keeps_principal_with_same_role_ids():
+    # PrivX returns role names; prepare() sends role IDs only
+    existing = _host([{'id': 'r1', 'name': 'admins'}, {'id': 'r2', 'name': 'users'}])
+    desired = _host([{'id': 'r2'}, {'id': 'r1'}])
+
+    merged = PrivXHostStore.merge(existing, desired)
+
+    assert merged['principals'] == existing['principals']
+    assert PrivXHostStore.diff(existing, merged) is None
+
+
+def test_merge_replaces_principal_with_different_role_ids():
+    existing = _host([{'id': 'r1', 'name': 'admins'}])
+    desired = _host([{'id': 'r1'}, {'id': 'r2'}])
+
+    merged = PrivXHostStore.merge(existing, desired)
+
+    assert merged['principals'] == desired['principals']
+    assert PrivXHostStore.diff(existing, merged) is not None
+
+
+def test_diff_values_reports_role_name_changes():
+    # Whole role dicts differ, which is why merge() compares role IDs instead
+    assert diff_values([{'id': 'r1', 'name': 'admins'}], [{'id': 'r1'}], 'roles') is not None
+
+
+class _Response(object):
+
+    def __init__(self, data=None, ok=True, status=200):
+        self.ok = ok
+        self.status = status
+        self.data = data
+
+
+class _FakeAPI(object):
+
+    def __init__(self, hosts):
+        self.hosts = list(hosts)
+        self.deleted = []
+
+    def get_hosts(self, offset=0, limit=50):
+        return _Response({'count': len(self.hosts), 'items': self.hosts[offset:offset + limit]})
+
+    def delete_host(self, host_id):
+        self.deleted.append(host_id)
+        return _Response()
+
+
+def _store(api):
+    # No host in these tests has roles or an access group to resolve
+    return PrivXHostStore(api, directory=object(), page_size=2)
+
+
+def _existing():
+    return [
+        {'id': 'h1', 'common_name': 'keep.example.com'},
+        {'id': 'h2', 'common_name': 'dup.example.com'},
+        {'id': 'h3', 'common_name': 'dup.example.com'},
+        {'id': 'h4', 'common_name': 'other.example.com'},
+    ]
+
+
+def test_prune_after_reconcile_deletes_every_host_sharing_a_common_name():
+    api = _FakeAPI(_existing())
+    store = _store(api)
+    store.reconcile([{'common_name': 'keep.example.com'}], keep_index=True)
+
+    results, summary = store.prune({'keep.example.com'})
+
+    assert sorted(api.deleted) == ['h2', 'h3', 'h4']
+    assert summary == {'deleted': 3, 'would_delete': 0, 'failed': 0}
+
+
+def test_prune_without_index_matches_prune_after_reconcile():
+    api = _FakeAPI(_existing())
+
+    results, summary = _store(api).prune({'keep.example.com'})
+
+    assert sorted(api.deleted) == ['h2', 'h3', 'h4']
+
+
+def test_prune_in_check_mode_reports_would_delete():
+    api = _FakeAPI(_existing())
+
+    results, summary = _store(api).prune({'keep.example.com'}, check_mode=True)
+
+    assert api.deleted == []
+    assert {result['action'] for result in results} == {'would_delete'}
+    assert summary == {'deleted': 0, 'would_delete': 3, 'failed': 0}
@@ -0,0 +1,141 @@
+from ansible_collections.garnser.privx.plugins.module_utils.query import PrivXQuery, project
+
+
+class _Response(object):
+
+    def __init__(self, data, status=200):
+        self.ok = status < 400
+        self.status = status
+        self.data = data
+
+
+class _FakeAPI(object):
+    """Role and host-store stand-in; the host search matches substrings like PrivX does."""
+
+    def __init__(self):
+        self.roles = [
+            {'id': 'r1', 'name': 'admins', 'comment': 'Administrators'},
+            {'id': 'r2', 'name': 'users', 'comment': 'Everyone'},
+        ]
+        self.hosts = [
+            {'id': 'h1', 'common_name': 'web1.example.com', 'external_id': 'i-1', 'addresses': ['10.0.0.1'],
+             'access_group_id': 'ag1', 'tags': ['web']},
+            {'id': 'h2', 'common_name': 'web10.example.com', 'external_id': 'i-2', 'addresses': ['10.0.0.10'],
+             'access_group_id': 'ag1', 'tags': ['web']},
+            {'id': 'h3', 'common_name': 'db1.example.com', 'external_id': 'i-3', 'addresses': ['10.0.0.3'],
+             'access_group_id': 'ag2', 'tags': ['db']},
+        ]
+        self.calls = []
+
+    def get_roles(self, offset=0, limit=50):
+        self.calls.append('get_roles')
+        return _Response({'count': len(self.roles), 'items': self.roles[offset:offset + limit]})
+
+    def get_hosts(self, offset=0, limit=50):
+        self.calls.append('get_hosts')
+        return _Response({'count': len(self.hosts), 'items': self.hosts[offset:offset + limit]})
+
+    def search_hosts(self, search_payload=None, offset=0, limit=50):
+        self.calls.append('search_hosts')
+        hosts = [
+            host for host in self.hosts
+            if all(any(str(value) in str(field) for value in values for field in
+                       (host.get(key) if isinstance(host.get(key), list) else [host.get(key)]))
+                   for key, values in (search_payload or {}).items())
+        ]
+        return _Response({'count': len(hosts), 'items': hosts[offset:offset + limit]})
+
+    def get_host(self, host_id):
+        self.calls.append('get_host')
+        for host in self.hosts:
+            if host['id'] == host_id:
+                return _Response(host)
+        return _Response({'error': 'not found'}, status=404)
+
+
+def test_project_keeps_only_the_requested_fields():
+    host = {'id': 'h1', 'common_name': 'web1', 'tags': []}
+
+    assert project(host, ['id', 'missing']) == {'id': 'h1'}
+    assert project(host, 'all') is host
+    assert project(host, None) is host
+
+
+def test_directory_resolves_names_and_ids_in_order_with_one_listing():
+    api = _FakeAPI()
+    query = PrivXQuery(api)
+
+    result = query.directory('roles', ['users', 'r1', 'nobody', 'admins'])
+
+    assert result['items'] == [{'id': 'r2', 'name': 'users'}, {'id': 'r1', 'name': 'admins'}]
+    assert result['count'] == 2
+    assert result['missing'] == ['nobody']
+    assert api.calls == ['get_roles']
+
+
+def test_directory_dict_refs_match_only_their_own_key():
+    query = PrivXQuery(_FakeAPI())
+
+    result = query.directory('roles', {'name': ['r1', 'admins'], 'id': 'users'}, fields=['name', 'comment'])
+
+    assert result['items'] == [{'name': 'admins', 'comment': 'Administrators'}]
+    assert result['missing'] == ['r1', 'users']
+
+
+def test_host_search_is_narrowed_to_exact_matches():
+    api = _FakeAPI()
+    query = PrivXQuery(api)
+
+    result = query.hosts(['web1.example.com', 'db1.example.com'])
+    by_address = query.hosts({'addresses': '10.0.0.1'}, fields=['id'])
+
+    assert [host['id'] for host in result['items']] == ['h1', 'h3']
+    assert result['missing'] == []
+    # The search also returns 10.0.0.10
+    assert by_address['items'] == [{'id': 'h1'}]
+    assert api.calls == ['search_hosts', 'search_hosts']
+
+
+def test_plain_refs_matching_no_common_name_are_fetched_as_ids():
+    api = _FakeAPI()
+    query = PrivXQuery(api)
+
+    result = query.hosts(['web1.example.com', 'h2', 'h9'], fields=['id'])
+
+    assert result['items'] == [{'id': 'h1'}, {'id': 'h2'}]
+    assert result['missing'] == ['h9']
+    assert api.calls == ['search_hosts', 'get_host', 'get_host']
+
+
+def test_host_dict_filters_must_all_match():
+    query = PrivXQuery(_FakeAPI())
+
+    result = query.hosts({'addresses': ['10.0.0.1', '10.0.0.3'], 'external_id': 'i-3'}, fields=['id'])
+    missing = query.hosts({'common_name': ['web1.example.com', 'web2.example.com']}, fields=['id'])
+
+    assert result['items'] == [{'id': 'h3'}]
+    assert result['missing'] == ['10.0.0.1']
+    assert missing['items'] == [{'id': 'h1'}]
+    assert missing['missing'] == ['web2.example.com']
+
+
+def test_host_ids_are_fetched_without_a_search():
+    api = _FakeAPI()
+    query = PrivXQuery(api)
+
+    result = query.hosts({'id': ['h3', 'h9']}, fields='all')
+
+    assert result['items'] == [api.hosts[2]]
+    assert result['missing'] == ['h9']
+    assert api.calls == ['get_host', 'get_host']
+
+
+def test_list_hosts_projects_every_host():
+    api = _FakeAPI()
+    query = PrivXQuery(api, page_size=2)
+
+    result = query.list_hosts(fields=['common_name', 'tags'])
+
+    assert result['count'] == 3
+    assert result['items'][2] == {'common_name': 'db1.example.com', 'tags': ['db']}
+    assert api.calls == ['get_hosts', 'get_hosts']
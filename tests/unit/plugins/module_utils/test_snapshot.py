@@ -0,0 +1,67 @@
+from ansible_collections.garnser.privx.plugins.module_utils.snapshot import PrivXSnapshot, parse_timestamp
+
+
+class _Response(object):
+
+    def __init__(self, data):
+        self.ok = True
+        self.status = 200
+        self.data = data
+
+
+class _FakeAPI(object):
+    """Host-store stand-in sorting hosts by their parsed 'updated' timestamps."""
+
+    def __init__(self):
+        self.hosts = {}
+
+    def put(self, host_id, updated):
+        self.hosts[host_id] = {'id': host_id, 'common_name': host_id + '.example.com', 'updated': updated}
+
+    def get_hosts(self, offset=0, limit=50, sort_key=None, sort_dir=None):
+        hosts = sorted(self.hosts.values(), key=lambda host: parse_timestamp(host['updated']), reverse=True)
+        return _Response({'count': len(hosts), 'items': hosts[offset:offset + limit]})
+
+    def get_roles(self, offset=0, limit=50):
+        return _Response({'count': 0, 'items': []})
+
+    def get_access_groups(self, offset=0, limit=50):
+        return _Response({'count': 0, 'items': []})
+
+
+def test_parse_timestamp_ignores_precision_and_offset():
+    assert parse_timestamp('2024-01-01T00:00:00Z') == parse_timestamp('2024-01-01T00:00:00.000000Z')
+    assert parse_timestamp('2024-01-01T02:00:00.5+02:00') == parse_timestamp('2024-01-01T00:00:00.500Z')
+    assert parse_timestamp('2024-01-01T00:00:00.9Z') < parse_timestamp('2024-01-01T00:00:01Z')
+    assert parse_timestamp('yesterday') is None
+
+
+def test_incremental_refresh_drops_host_deleted_alongside_a_create(tmp_path):
+    api = _FakeAPI()
+    api.put('a', '2024-01-01T00:00:00Z')
+    api.put('b', '2024-01-01T00:00:01Z')
+    with PrivXSnapshot(str(tmp_path / 'snapshot.db')) as snapshot:
+        assert snapshot.refresh(api)['full'] is True
+
+        # Same count as before, and a timestamp that sorts lower as a string
+        del api.hosts['a']
+        api.put('c', '2024-01-01T00:00:01.5Z')
+        snapshot.refresh(api)
+
+        assert snapshot.get_host('a') is None
+        assert snapshot.get_host('c') is not None
+
+
+def test_incremental_refresh_fetches_only_updated_hosts(tmp_path):
+    api = _FakeAPI()
+    for i in range(5):
+        api.put('host%d' % i, '2024-01-01T00:00:0%dZ' % i)
+    with PrivXSnapshot(str(tmp_path / 'snapshot.db')) as snapshot:
+        snapshot.refresh(api)
+        api.put('host1', '2024-01-01T00:00:10.25Z')
+
+        summary = snapshot.refresh(api)
+
+        assert summary['full'] is False
+        assert summary['hosts_fetched'] == 1
+        assert snapshot.get_host('host1')['updated'] == '2024-01-01T00:00:10.25Z'
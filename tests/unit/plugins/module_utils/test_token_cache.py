@@ -0,0 +1,121 @@
+import base64
+import json
+import os
+import stat
+import threading
+import time
+
+from ansible_collections.garnser.privx.plugins.module_utils.governor import govern
+from ansible_collections.garnser.privx.plugins.module_utils.token_cache import (
+    PrivXTokenCache,
+    authenticate_privx_api,
+    token_cache_key,
+    token_expiry,
+)
+
+
+class _Response(object):
+
+    def __init__(self, status, data=None):
+        self.status = status
+        self.ok = status == 200
+        self.data = data or {}
+
+
+class _FakeSDK(object):
+    """privx_api.PrivXAPI stand-in that only accepts the token it issued last."""
+
+    def __init__(self):
+        self._access_token = ''
+        self.issued = None
+        self.logins = 0
+        self.calls = 0
+
+    def authenticate(self, username, password):
+        self.logins += 1
+        self.issued = self._access_token = 'token-%d' % self.logins
+
+    def get_hosts(self, offset=0, limit=50):
+        self.calls += 1
+        if self._access_token != self.issued:
+            return _Response(401, {'error': 'invalid token'})
+        return _Response(200, {'count': 0, 'items': []})
+
+
+def _jwt(exp):
+    claims = base64.urlsafe_b64encode(json.dumps({'exp': exp}).encode('utf-8')).decode('ascii').rstrip('=')
+    return 'header.%s.signature' % claims
+
+
+def _config(tmp_path):
+    return {'hostname': 'privx.example.com', 'hostport': 443, 'token_cache_dir': str(tmp_path / 'tokens'),
+            'api_client_id': 'api', 'api_client_secret': 'secret', 'max_retries': 0}
+
+
+def test_rejected_cached_token_is_replaced_and_the_call_repeated(tmp_path):
+    config = _config(tmp_path)
+    # A token cached by an earlier run, since revoked on the server
+    cache = PrivXTokenCache(config['token_cache_dir'])
+    assert cache.usable
+    cache._write(token_cache_key(config), 'revoked')
+    sdk = _FakeSDK()
+    privx = govern(sdk, config)
+    assert authenticate_privx_api(privx, config) is False
+
+    response = privx.get_hosts()
+
+    assert response.status == 200
+    assert (sdk.logins, sdk.calls) == (1, 2)
+    assert cache.get(token_cache_key(config)) == 'token-1'
+
+
+def test_invalidate_keeps_a_token_replaced_by_another_process(tmp_path):
+    cache = PrivXTokenCache(str(tmp_path))
+    cache._write('key', 'fresh')
+
+    cache.invalidate('key', 'stale')
+    assert cache.get('key') == 'fresh'
+    cache.invalidate('key', 'fresh')
+    assert cache.get('key') is None
+
+
+def test_tokens_about_to_expire_are_not_reused(tmp_path):
+    cache = PrivXTokenCache(str(tmp_path), refresh_margin=30)
+    assert token_expiry(_jwt(1234567890)) == 1234567890
+    cache._write('soon', _jwt(time.time() + 10))
+    cache._write('later', _jwt(time.time() + 300))
+
+    assert cache.get('soon') is None
+    assert cache.get('later') is not None
+
+
+def test_cache_files_are_owner_only_and_open_directories_are_refused(tmp_path):
+    cache = PrivXTokenCache(str(tmp_path / 'tokens'))
+    assert cache.usable
+    cache._write('key', 'token')
+
+    assert stat.S_IMODE(os.stat(cache.cache_dir).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(cache._path('key')).st_mode) == 0o600
+    os.chmod(cache.cache_dir, 0o755)
+    assert not cache.usable
+
+
+def test_concurrent_callers_share_one_authentication(tmp_path):
+    config = _config(tmp_path)
+    cache = PrivXTokenCache(config['token_cache_dir'])
+    assert cache.usable
+    logins = []
+
+    class _SlowSDK(_FakeSDK):
+        def authenticate(self, username, password):
+            time.sleep(0.1)
+            logins.append(1)
+            self._access_token = 'shared'
+
+    threads = [threading.Thread(target=cache.authenticate, args=(_SlowSDK(), config)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(logins) == 1